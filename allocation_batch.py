@@ -0,0 +1,204 @@
+"""
+BTP/MTP Batch Allocation
+Allocates many cohorts (departments, programmes) together
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+import pandas as pd
+from allocation_engine import AllocationEngine
+from allocation_io import read_students_csv
+
+logger = logging.getLogger(__name__)
+
+CohortSource = Union[str, Tuple[pd.DataFrame, List[str]]]
+
+
+def split_cohorts(file_path: str, cohort_column: str,
+                  csv_engine: Optional[str] = None) -> Dict[str, Tuple[pd.DataFrame, List[str]]]:
+    """
+    Read one file holding several cohorts and split it on a key column
+    
+    The file is parsed once. Each cohort keeps only the faculty columns that
+    at least one of its students ranked, so departments can share a header.
+    
+    Args:
+        file_path: Input CSV with a cohort key column
+        cohort_column: Name of the key column
+        csv_engine: Optional parser, 'pyarrow' for the Arrow CSV reader
+    
+    Returns:
+        Dict[str, Tuple[pd.DataFrame, List[str]]]: Student data and faculty
+        names per cohort, in order of first appearance
+    """
+    students_data, faculties = read_students_csv(file_path, csv_engine, extra_columns=(cohort_column,))
+    if students_data[cohort_column].isna().any():
+        raise ValueError(f"Some students have no value in the cohort column '{cohort_column}'")
+    
+    cohorts = {}
+    for cohort, group in students_data.groupby(cohort_column, sort=False):
+        group = group.drop(columns=cohort_column).reset_index(drop=True)
+        ranked = [faculty for faculty in faculties if group[faculty].notna().any()]
+        group = group.drop(columns=[faculty for faculty in faculties if faculty not in ranked])
+        cohorts[str(cohort)] = (group, ranked)
+    
+    logger.info("Split %s students from %s into %s cohorts", len(students_data), file_path, len(cohorts))
+    return cohorts
+
+
+def cohort_names(paths: List[str]) -> Dict[str, str]:
+    """
+    Name input files as cohorts by file name (without extension)
+    
+    Args:
+        paths: Input CSV paths
+    
+    Returns:
+        Dict[str, str]: Cohort name -> path, in input order; raises
+        ValueError if two files would get the same name
+    """
+    cohorts = {}
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name in cohorts:
+            raise ValueError(f"Input files {cohorts[name]} and {path} would both be cohort '{name}'")
+        cohorts[name] = path
+    return cohorts
+
+
+def _allocate_cohort(task: Tuple) -> Tuple[str, pd.DataFrame, pd.DataFrame, Dict, Dict]:
+    """Load (if given a path), allocate and summarise one cohort"""
+    name, source, strategy, strategy_options, capacities, csv_engine, use_cache, cache_dir = task
+    
+    engine = AllocationEngine(strategy, strategy_options)
+    if isinstance(source, str):
+        if not engine.load_data(source, csv_engine=csv_engine, use_cache=use_cache, cache_dir=cache_dir):
+            raise ValueError(f"Could not load cohort '{name}' from {source}")
+    else:
+        engine.students_data, engine.faculties = source
+    if capacities is not None and not engine.load_capacities(capacities):
+        raise ValueError(f"Could not load capacities for cohort '{name}'")
+    
+    allocation_results = engine.allocate_students()
+    preference_stats = engine.generate_preference_stats()
+    return name, allocation_results, preference_stats, engine.get_allocation_summary(), engine.get_metrics()
+
+
+def _quiet_worker(level: int) -> None:
+    """Raise the engine log level in a worker so per-cohort progress messages are skipped"""
+    logging.getLogger('allocation_engine').setLevel(level)
+
+
+def allocate_cohorts(cohorts: Union[List[str], Dict[str, CohortSource]], strategy: str = 'cycle',
+                     strategy_options: Optional[Dict] = None, capacities: Optional[Dict[str, Union[str, Dict]]] = None,
+                     max_workers: Optional[int] = None, csv_engine: Optional[str] = None,
+                     log_level: int = logging.WARNING, use_cache: bool = False,
+                     cache_dir: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Allocate several cohorts concurrently
+    
+    Each worker process parses and allocates whole cohorts, so files are
+    read in parallel and only the results travel back.
+    
+    Args:
+        cohorts: Input CSV paths (named by file name, see cohort_names), or
+            cohort name -> path or (students_data, faculties), e.g. from split_cohorts
+        strategy: Registered strategy name for every cohort
+        strategy_options: Strategy options for every cohort
+        capacities: Optional cohort name -> capacities (see AllocationEngine.load_capacities)
+        max_workers: Worker processes, defaults to the CPU count; 1 runs in-process
+        csv_engine: Optional parser, 'pyarrow' for the Arrow CSV reader
+        log_level: Engine log level inside the batch, WARNING by default
+        use_cache: Load cohorts given as paths through their parsed-input
+            sidecar (see AllocationEngine.load_data)
+        cache_dir: Optional directory for sidecars, defaults to next to each CSV
+    
+    Returns:
+        Dict[str, Dict]: Per cohort, 'allocation' and 'preference_stats'
+        DataFrames and the 'summary' and engine 'metrics' dicts
+    """
+    if not isinstance(cohorts, dict):
+        cohorts = cohort_names(cohorts)
+    
+    capacities = capacities or {}
+    tasks = [(name, source, strategy, strategy_options, capacities.get(name), csv_engine, use_cache, cache_dir)
+             for name, source in cohorts.items()]
+    workers = min(max_workers or os.cpu_count() or 1, max(len(tasks), 1))
+    logger.info("Allocating %s cohorts with %s workers (strategy: %s)", len(tasks), workers, strategy)
+    
+    if workers <= 1:
+        engine_logger = logging.getLogger('allocation_engine')
+        previous_level = engine_logger.level
+        _quiet_worker(log_level)
+        try:
+            outcomes = [_allocate_cohort(task) for task in tasks]
+        finally:
+            engine_logger.setLevel(previous_level)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_quiet_worker, initargs=(log_level,)) as pool:
+            outcomes = list(pool.map(_allocate_cohort, tasks))
+    
+    results = {
+        name: {'allocation': allocation, 'preference_stats': stats, 'summary': summary, 'metrics': metrics}
+        for name, allocation, stats, summary, metrics in outcomes
+    }
+    logger.info("Allocated %s students in %s cohorts",
+                sum(len(result['allocation']) for result in results.values()), len(results))
+    
+    return results
+
+
+def combine_cohort_results(results: Dict[str, Dict]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Stack every cohort's outputs into one allocation table and one
+    preference statistics table, each with a leading Cohort column
+    
+    Args:
+        results: Output of allocate_cohorts
+    
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: Combined allocation results and
+        preference statistics
+    """
+    names = list(results)
+    allocation = pd.concat(
+        [results[name]['allocation'][['Roll', 'Name', 'Email', 'CGPA', 'Allocated']] for name in names],
+        keys=names, names=['Cohort', None]
+    ).reset_index(level=0)
+    # Cohorts can have different faculty counts; missing rank columns are 0
+    stats = pd.concat(
+        [results[name]['preference_stats'] for name in names], keys=names, names=['Cohort', None]
+    ).reset_index(level=0)
+    count_columns = [column for column in stats.columns if column.startswith('Count Pref')]
+    stats[count_columns] = stats[count_columns].fillna(0).astype('int64')
+    return allocation, stats
+
+
+def save_cohort_results(results: Dict[str, Dict], allocation_path: str, stats_path: str) -> bool:
+    """
+    Write every cohort's outputs in one pass: one allocation file and one
+    preference statistics file, each with a leading Cohort column
+    
+    Args:
+        results: Output of allocate_cohorts
+        allocation_path: Path for the combined allocation results
+        stats_path: Path for the combined preference statistics
+    
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        names = list(results)
+        allocation, stats = combine_cohort_results(results)
+        
+        allocation.to_csv(allocation_path, index=False)
+        stats.to_csv(stats_path, index=False)
+        logger.info("Saved %s cohorts to %s and %s", len(names), allocation_path, stats_path)
+        
+        return True
+    
+    except Exception as e:
+        logger.error("Error saving cohort results: %s", e)
+        return False
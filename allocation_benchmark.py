@@ -0,0 +1,193 @@
+"""
+BTP/MTP Allocation Benchmarks
+Synthetic cohort generator and per-phase timing across a size grid
+"""
+
+import json
+import logging
+import os
+import platform
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from allocation_engine import AllocationEngine
+
+logger = logging.getLogger(__name__)
+
+PHASES = ['load_data', 'sort_students_by_cgpa', 'allocate_students', 'generate_preference_stats',
+          'save_allocation_results', 'save_preference_stats']
+
+DEFAULT_SIZES = [(1000, 20), (10000, 50), (50000, 100)]
+
+
+def generate_cohort(n_students: int, n_faculties: int, seed: Optional[int] = None, skew: float = 1.0,
+                    blank_fraction: float = 0.0) -> pd.DataFrame:
+    """
+    Synthetic student preference data with skewed faculty popularity
+    
+    Faculty popularity follows a Zipf law (weight 1 / rank ** skew) and each
+    student's ranking is a Plackett-Luce draw from it (Gumbel-max trick), so
+    a few faculties are in most students' top choices, as in real cohorts.
+    CGPAs are normal around 7.5 and rounded to two decimals, which gives
+    realistic ties.
+    
+    Args:
+        n_students: Number of students
+        n_faculties: Number of faculties
+        seed: Random seed
+        skew: Popularity skew, 0 for uniform
+        blank_fraction: Share of preferences left blank
+    
+    Returns:
+        pd.DataFrame: Data in the input CSV format
+    """
+    rng = np.random.default_rng(seed)
+    faculties = [f'F{idx:03d}' for idx in range(n_faculties)]
+    
+    log_weights = -skew * np.log(np.arange(1, n_faculties + 1))
+    keys = log_weights + rng.gumbel(size=(n_students, n_faculties))
+    # Rank of each faculty = position of its key in descending order
+    ranks = np.empty((n_students, n_faculties), dtype=np.float64)
+    np.put_along_axis(ranks, np.argsort(-keys, axis=1), np.arange(1, n_faculties + 1, dtype=np.float64), axis=1)
+    if blank_fraction:
+        ranks[rng.random(ranks.shape) < blank_fraction] = np.nan
+    
+    students = pd.DataFrame({
+        'Roll': [f'S{idx:07d}' for idx in range(n_students)],
+        'Name': [f'Student {idx}' for idx in range(n_students)],
+        'Email': [f's{idx}@example.com' for idx in range(n_students)],
+        'CGPA': np.round(np.clip(rng.normal(7.5, 1.0, n_students), 4.0, 10.0), 2)
+    })
+    rank_columns = pd.DataFrame(ranks, columns=faculties)
+    if not blank_fraction:
+        rank_columns = rank_columns.astype(np.int16)
+    
+    return pd.concat([students, rank_columns], axis=1)
+
+
+def time_phases(input_path: str, output_dir: str, strategy: str = 'cycle') -> Tuple[Dict[str, float], Tuple[int, int]]:
+    """
+    Time each engine phase once on a fresh engine
+    
+    allocate_students includes its own preprocessing (sort and preference
+    order), so sort_students_by_cgpa is timed on its own beforehand.
+    
+    Args:
+        input_path: Input CSV
+        output_dir: Directory for the saved outputs
+        strategy: Allocation strategy
+    
+    Returns:
+        Tuple[Dict[str, float], Tuple[int, int]]: Seconds per phase and the
+        (students, faculties) shape of the input
+    """
+    engine = AllocationEngine(strategy)
+    timings = {}
+    
+    def timed(phase, call, *args):
+        start = time.perf_counter()
+        result = call(*args)
+        timings[phase] = time.perf_counter() - start
+        return result
+    
+    if not timed('load_data', engine.load_data, input_path):
+        raise ValueError(f"Could not load {input_path}")
+    timed('sort_students_by_cgpa', engine.sort_students_by_cgpa)
+    timed('allocate_students', engine.allocate_students)
+    timed('generate_preference_stats', engine.generate_preference_stats)
+    timed('save_allocation_results', engine.save_allocation_results, os.path.join(output_dir, 'allocation.csv'))
+    timed('save_preference_stats', engine.save_preference_stats, os.path.join(output_dir, 'preference_stats.csv'))
+    
+    return timings, (len(engine.students_data), len(engine.faculties))
+
+
+def run_benchmarks(sizes: List[Tuple[int, int]] = None, repeat: int = 3, strategy: str = 'cycle',
+                   seed: int = 0, inputs: Optional[List[str]] = None) -> Dict:
+    """
+    Time every phase over a grid of synthetic cohort sizes and/or input files
+    
+    Args:
+        sizes: (students, faculties) pairs to generate
+        repeat: Runs per case; the minimum and median are reported
+        strategy: Allocation strategy
+        seed: Seed for the synthetic cohorts
+        inputs: Existing input CSVs to time as well
+    
+    Returns:
+        Dict: Machine-readable results with environment details and one
+        record per case and phase
+    """
+    sizes = DEFAULT_SIZES if sizes is None and not inputs else sizes or []
+    records = []
+    
+    with tempfile.TemporaryDirectory(prefix='allocation-bench-') as workdir:
+        cases = [(path, None) for path in inputs or []]
+        for n_students, n_faculties in sizes:
+            path = os.path.join(workdir, f'synthetic_{n_students}x{n_faculties}.csv')
+            generate_cohort(n_students, n_faculties, seed=seed).to_csv(path, index=False)
+            cases.append((path, f'synthetic_{n_students}x{n_faculties}'))
+        
+        for path, name in cases:
+            samples = [time_phases(path, workdir, strategy) for _ in range(repeat)]
+            n_students, n_faculties = samples[0][1]
+            for phase in PHASES:
+                values = [timings[phase] for timings, _ in samples]
+                records.append({
+                    'case': name or os.path.basename(path),
+                    'students': n_students,
+                    'faculties': n_faculties,
+                    'strategy': strategy,
+                    'phase': phase,
+                    'min_seconds': min(values),
+                    'median_seconds': statistics.median(values),
+                    'repeat': repeat
+                })
+            logger.info("Benchmarked %s", name or path)
+    
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count()
+        },
+        'results': records
+    }
+
+
+def find_regressions(current: Dict, baseline: Dict, max_slowdown: float = 1.5,
+                     min_seconds: float = 0.005) -> List[Dict]:
+    """
+    Cases and phases that got slower than the baseline allows
+    
+    Args:
+        current: Output of run_benchmarks
+        baseline: Earlier output of run_benchmarks
+        max_slowdown: Allowed ratio of current to baseline minimum time
+        min_seconds: Phases faster than this in the baseline are ignored as noise
+    
+    Returns:
+        List[Dict]: One entry per regression with both timings and the ratio
+    """
+    reference = {(record['case'], record['strategy'], record['phase']): record['min_seconds']
+                 for record in baseline['results']}
+    regressions = []
+    for record in current['results']:
+        before = reference.get((record['case'], record['strategy'], record['phase']))
+        if before is None or before < min_seconds:
+            continue
+        ratio = record['min_seconds'] / before
+        if ratio > max_slowdown:
+            regressions.append({'case': record['case'], 'phase': record['phase'],
+                                'baseline_seconds': before, 'seconds': record['min_seconds'], 'ratio': ratio})
+    return regressions
+
+
+def load_results(path: str) -> Dict:
+    """Read benchmark results written as JSON"""
+    with open(path) as handle:
+        return json.load(handle)
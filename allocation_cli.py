@@ -0,0 +1,313 @@
+"""
+BTP/MTP Allocation Command Line Interface
+btp-allocate run/stats/sweep/bench for cron jobs and batch schedulers
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+from allocation_logging import configure_logging, stop_queue_logging
+
+logger = logging.getLogger(__name__)
+
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_NO_INPUT = 3
+EXIT_REGRESSION = 4
+
+OUTPUT_FORMATS = ['csv', 'json']
+
+
+class UsageError(Exception):
+    """Inputs or options that cannot be used together, reported with EXIT_USAGE"""
+
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    """
+    Expand glob patterns into a sorted, de-duplicated list of files
+    
+    Args:
+        patterns: File names or glob patterns (** is recursive)
+    
+    Returns:
+        List[str]: Matching files
+    """
+    files = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        if not matches:
+            logger.warning("No input files match %s", pattern)
+        files.update(match for match in matches if os.path.isfile(match))
+    return sorted(files)
+
+
+def write_table(table, path: str, output_format: str) -> None:
+    """
+    Write a DataFrame in the chosen output format
+    
+    Args:
+        table: DataFrame to write
+        path: Destination path (without extension)
+        output_format: 'csv' or 'json' (records)
+    """
+    if output_format == 'json':
+        table.to_json(f'{path}.json', orient='records', indent=2)
+    else:
+        table.to_csv(f'{path}.csv', index=False)
+
+
+def _load_cohorts(args) -> Optional[Dict]:
+    """
+    Cohort mapping for run/stats: input files, or each file split on --cohort-column
+    
+    Cohort names become output file names, so two inputs that would share a
+    name raise UsageError instead of overwriting each other's results.
+    """
+    from allocation_batch import cohort_names, split_cohorts
+    
+    files = expand_inputs(args.inputs)
+    if not files:
+        return None
+    
+    if args.cohort_column:
+        cohorts, sources = {}, {}
+        for path in files:
+            for name, cohort in split_cohorts(path, args.cohort_column).items():
+                if name in cohorts:
+                    raise UsageError(f"Cohort '{name}' appears in both {sources[name]} and {path}")
+                cohorts[name], sources[name] = cohort, path
+        return cohorts
+    
+    try:
+        return cohort_names(files)
+    except ValueError as e:
+        raise UsageError(str(e))
+
+
+def command_run(args) -> int:
+    """Allocate every input and write results and preference statistics"""
+    from allocation_batch import allocate_cohorts, combine_cohort_results
+    
+    cohorts = _load_cohorts(args)
+    if not cohorts:
+        return EXIT_NO_INPUT
+    
+    options = json.loads(args.options) if args.options else None
+    capacities = {name: args.capacities for name in cohorts} if args.capacities else None
+    results = allocate_cohorts(cohorts, args.strategy, options, capacities, args.workers,
+                               use_cache=args.cache or args.cache_dir is not None, cache_dir=args.cache_dir)
+    
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.combined:
+        allocation, preference_stats = combine_cohort_results(results)
+        write_table(allocation, os.path.join(args.output_dir, 'allocation'), args.format)
+        write_table(preference_stats, os.path.join(args.output_dir, 'preference_stats'), args.format)
+    else:
+        for name, result in results.items():
+            output_data = result['allocation'][['Roll', 'Name', 'Email', 'CGPA', 'Allocated']]
+            write_table(output_data, os.path.join(args.output_dir, f'{name}_allocation'), args.format)
+            write_table(result['preference_stats'], os.path.join(args.output_dir, f'{name}_preference_stats'),
+                        args.format)
+    
+    if args.metrics:
+        with open(args.metrics, 'a') as handle:
+            for name, result in results.items():
+                handle.write(json.dumps({'timestamp': time.time(), 'cohort': name, **result['metrics']}) + '\n')
+    
+    for name, result in results.items():
+        satisfaction = result['summary']['preference_satisfaction']
+        print(f"{name}: {result['summary']['total_students']} students, "
+              f"1st choice {satisfaction['pref_1']}, fallback {satisfaction['fallback']}")
+    return EXIT_OK
+
+
+def command_stats(args) -> int:
+    """Write preference statistics without allocating"""
+    from allocation_engine import AllocationEngine
+    
+    cohorts = _load_cohorts(args)
+    if not cohorts:
+        return EXIT_NO_INPUT
+    
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name, source in cohorts.items():
+        engine = AllocationEngine()
+        if isinstance(source, str):
+            if not engine.load_data(source, use_cache=args.cache or args.cache_dir is not None,
+                                    cache_dir=args.cache_dir):
+                return EXIT_FAILURE
+        else:
+            engine.students_data, engine.faculties = source
+        write_table(engine.generate_preference_stats(), os.path.join(args.output_dir, f'{name}_preference_stats'),
+                    args.format)
+    return EXIT_OK
+
+
+def command_sweep(args) -> int:
+    """Compare strategies and capacity files on one input"""
+    from allocation_sweep import run_sweep
+    
+    files = expand_inputs([args.input])
+    if len(files) != 1:
+        logger.error("sweep needs exactly one input file, %s matches %s", args.input, len(files))
+        return EXIT_NO_INPUT if not files else EXIT_USAGE
+    
+    capacities = args.capacities or [None]
+    seeds = args.tie_break_seeds or [None]
+    scenarios = [{'strategy': strategy, 'capacities': capacity, 'tie_break_seed': seed}
+                 for strategy in args.strategies or ['cycle'] for capacity in capacities for seed in seeds]
+    table = run_sweep(files[0], scenarios, args.workers)
+    
+    print(table.to_string())
+    if args.output:
+        table.to_csv(args.output)
+    return EXIT_OK
+
+
+def parse_sizes(text: str) -> List[Tuple[int, int]]:
+    """
+    Parse a size grid like '1000x20,10000x50'
+    
+    Args:
+        text: Comma-separated STUDENTSxFACULTIES pairs
+    
+    Returns:
+        List[Tuple[int, int]]: (students, faculties) pairs
+    """
+    try:
+        sizes = [tuple(int(part) for part in size.lower().split('x')) for size in text.split(',') if size]
+    except ValueError:
+        sizes = []
+    if not sizes or any(len(size) != 2 for size in sizes):
+        raise argparse.ArgumentTypeError(f"Sizes must look like 1000x20,10000x50, got '{text}'")
+    return sizes
+
+
+def command_bench(args) -> int:
+    """Time each engine phase on synthetic cohorts and/or input files"""
+    from allocation_benchmark import find_regressions, load_results, run_benchmarks
+    
+    inputs = expand_inputs(args.inputs) if args.inputs else []
+    if args.inputs and not inputs:
+        return EXIT_NO_INPUT
+    
+    results = run_benchmarks(args.sizes, args.repeat, args.strategy, args.seed, inputs)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output)
+    else:
+        print(output)
+    
+    if args.baseline:
+        regressions = find_regressions(results, load_results(args.baseline), args.max_slowdown)
+        for regression in regressions:
+            logger.error("%s %s: %.4fs vs %.4fs baseline (%.2fx)", regression['case'], regression['phase'],
+                         regression['seconds'], regression['baseline_seconds'], regression['ratio'])
+        if regressions:
+            return EXIT_REGRESSION
+    return EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Argument parser for btp-allocate and its subcommands"""
+    from allocation_strategies import STRATEGIES
+    
+    parser = argparse.ArgumentParser(prog='btp-allocate', description="BTP/MTP faculty allocation")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log progress messages")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Only log errors")
+    parser.add_argument('--log-file', help="Also append INFO and above to this file (written from a background thread)")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    
+    def add_inputs(subparser):
+        subparser.add_argument('inputs', nargs='+', help="Input CSV files or glob patterns")
+        subparser.add_argument('--cohort-column', help="Split each input into cohorts on this column")
+        subparser.add_argument('--output-dir', default='.', help="Directory for output files (default: .)")
+        subparser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', help="Output format (default: csv)")
+        subparser.add_argument('--cache', action='store_true',
+                               help="Keep a parsed copy of each input file so later runs skip CSV parsing")
+        subparser.add_argument('--cache-dir',
+                               help="Directory for the parsed copies (implies --cache, default: next to each input)")
+    
+    run = subcommands.add_parser('run', help="Allocate students and write results")
+    add_inputs(run)
+    run.add_argument('--strategy', choices=sorted(STRATEGIES), default='cycle', help="Allocation strategy")
+    run.add_argument('--options', help="Strategy options as JSON, e.g. '{\"top_k\": 10}'")
+    run.add_argument('--capacities', help="Capacity CSV (Fac, Max, Min) applied to every input")
+    run.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    run.add_argument('--combined', action='store_true',
+                     help="Write one allocation and one preference_stats file with a Cohort column")
+    run.add_argument('--metrics', help="Append per-cohort phase timings and counters to this JSON Lines file")
+    run.set_defaults(handler=command_run)
+    
+    stats = subcommands.add_parser('stats', help="Write preference statistics only")
+    add_inputs(stats)
+    stats.set_defaults(handler=command_stats)
+    
+    sweep = subcommands.add_parser('sweep', help="Compare strategies and capacities on one input")
+    sweep.add_argument('input', help="Input CSV file")
+    sweep.add_argument('--strategy', action='append', dest='strategies', choices=sorted(STRATEGIES),
+                       help="Strategy to run (repeatable, default: cycle)")
+    sweep.add_argument('--capacities', action='append', help="Capacity CSV to run every strategy with (repeatable)")
+    sweep.add_argument('--tie-break-seed', type=int, action='append', dest='tie_break_seeds',
+                       help="Also run every scenario with equal-CGPA students in this seeded random order (repeatable)")
+    sweep.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    sweep.add_argument('--output', help="Write the comparison table to this CSV")
+    sweep.set_defaults(handler=command_sweep)
+    
+    bench = subcommands.add_parser('bench', help="Time the engine phases on synthetic cohorts or input files")
+    bench.add_argument('inputs', nargs='*', help="Input CSV files or glob patterns to time as well")
+    bench.add_argument('--sizes', type=parse_sizes, default=None,
+                       help="Synthetic STUDENTSxFACULTIES grid, e.g. 1000x20,10000x50 (default grid without inputs)")
+    bench.add_argument('--strategy', choices=sorted(STRATEGIES), default='cycle', help="Allocation strategy")
+    bench.add_argument('--repeat', type=int, default=3, help="Runs per case (default: 3)")
+    bench.add_argument('--seed', type=int, default=0, help="Seed for synthetic cohorts (default: 0)")
+    bench.add_argument('--output', help="Write JSON results to this file instead of stdout")
+    bench.add_argument('--baseline', help="Earlier JSON results to compare against")
+    bench.add_argument('--max-slowdown', type=float, default=1.5,
+                       help="Fail if a phase is this many times slower than the baseline (default: 1.5)")
+    bench.set_defaults(handler=command_bench)
+    
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Entry point for btp-allocate
+    
+    Returns:
+        int: Exit code (0 ok, 1 allocation or I/O failure, 2 usage error, 3 no input files,
+        4 benchmark regression)
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    
+    level = logging.ERROR if args.quiet else logging.INFO if args.verbose else logging.WARNING
+    # The log file gets INFO even when the console is quieter
+    listener = configure_logging(args.log_file, logging.INFO, console_level=level)
+    
+    try:
+        exit_code = args.handler(args)
+    except UsageError as e:
+        logger.error("%s", e)
+        return EXIT_USAGE
+    except Exception as e:
+        logger.error("%s failed: %s", args.command, e)
+        return EXIT_FAILURE
+    finally:
+        if listener is not None:
+            stop_queue_logging(listener)
+    
+    if exit_code == EXIT_NO_INPUT:
+        logger.error("No input files found")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,516 @@
+"""
+BTP/MTP Allocation Input/Output
+Typed, validated loading of student preference files
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import numpy as np
+
+# pandas is imported inside the functions that build frames, so the numpy-only
+# helpers (snapshots, rank matrices) stay cheap to import in worker processes
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['Roll', 'Name', 'Email', 'CGPA']
+
+# Identity columns are kept as strings; CGPA stays float64 so printed values
+# and the CGPA sort order match the untyped loader exactly
+IDENTITY_DTYPES = {'Roll': 'string', 'Name': 'string', 'Email': 'string', 'CGPA': 'float64'}
+
+# Ranks are parsed as float32 (fast, blank-tolerant) and then narrowed to
+# int16, or to nullable Int16 for columns with blank preferences
+RANK_PARSE_DTYPE = 'float32'
+
+# (header, extra columns) -> (dtype mapping, faculty columns), so repeated loads skip inference
+_schema_cache: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], Tuple[Dict[str, str], List[str]]] = {}
+
+
+def infer_schema(columns: List[str], extra_columns: Tuple[str, ...] = ()) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Work out column dtypes and faculty columns from a header row
+    
+    Args:
+        columns: Column names in file order
+        extra_columns: Non-faculty columns read as strings, e.g. a cohort key
+    
+    Returns:
+        Tuple[Dict[str, str], List[str]]: dtype per column and the faculty
+        columns (everything after CGPA except extra_columns)
+    """
+    key = (tuple(columns), tuple(extra_columns))
+    if key in _schema_cache:
+        return _schema_cache[key]
+    
+    missing_columns = [col for col in REQUIRED_COLUMNS + list(extra_columns) if col not in columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {missing_columns}")
+    
+    faculties = [col for col in columns[columns.index('CGPA') + 1:] if col not in extra_columns]
+    if not faculties:
+        raise ValueError("No faculty preference columns found after CGPA")
+    
+    dtypes = dict(IDENTITY_DTYPES)
+    dtypes.update({column: 'string' for column in extra_columns})
+    dtypes.update({faculty: RANK_PARSE_DTYPE for faculty in faculties})
+    
+    _schema_cache[key] = (dtypes, faculties)
+    return dtypes, faculties
+
+
+def resolve_csv_engine(csv_engine: Optional[str]) -> str:
+    """
+    Pick the pandas CSV parser, falling back to the C parser if pyarrow is missing
+    
+    Args:
+        csv_engine: 'pyarrow', 'c' or None for the default
+    
+    Returns:
+        str: Parser name for pd.read_csv
+    """
+    if csv_engine != 'pyarrow':
+        return csv_engine or 'c'
+    
+    try:
+        import pyarrow  # noqa: F401
+        return 'pyarrow'
+    except ImportError:
+        logger.warning("pyarrow is not installed, using the default CSV parser")
+        return 'c'
+
+
+def read_students_csv(file_path, csv_engine: Optional[str] = None,
+                      extra_columns: Tuple[str, ...] = ()) -> Tuple['pd.DataFrame', List[str]]:
+    """
+    Read a student preference CSV with explicit dtypes and validate it
+    
+    Roll/Name/Email are read as strings, CGPA as float64 and faculty rank
+    columns as int16 (nullable Int16 where a preference is blank). Parsing
+    with explicit dtypes rejects non-numeric values during the read, and
+    the rank block is checked for whole numbers while it is narrowed.
+    
+    Args:
+        file_path: Path or file-like object of the input CSV
+        csv_engine: Optional parser, 'pyarrow' for the Arrow CSV reader
+        extra_columns: Non-faculty columns to keep as strings, e.g. a cohort key
+    
+    Returns:
+        Tuple[pd.DataFrame, List[str]]: Student data and faculty names
+    """
+    import pandas as pd
+    
+    header = pd.read_csv(file_path, nrows=0)
+    if hasattr(file_path, 'seek'):
+        file_path.seek(0)
+    dtypes, faculties = infer_schema(list(header.columns), tuple(extra_columns))
+    
+    try:
+        students_data = pd.read_csv(file_path, dtype=dtypes, engine=resolve_csv_engine(csv_engine))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Input does not match the expected schema (numeric CGPA and ranks): {e}")
+    
+    rank_block = narrow_rank_block(students_data[faculties].to_numpy(dtype=np.float32), faculties, students_data.index)
+    students_data = pd.concat([students_data.drop(columns=faculties), rank_block], axis=1)
+    
+    return students_data, faculties
+
+
+def validate_rank_block(ranks: np.ndarray, n_faculties: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Check a float rank block and narrow it to int16
+    
+    Args:
+        ranks: float matrix (student x faculty), NaN for blank preferences
+        n_faculties: Number of faculties
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray, int]: int16 ranks (0 where blank), the
+        blank mask and the number of ranks outside 1..n_faculties
+    """
+    blank = np.isnan(ranks)
+    filled = np.where(blank, 0, ranks)
+    
+    if (filled != np.floor(filled)).any():
+        raise ValueError("Preference ranks must be whole numbers")
+    if (np.abs(filled) > np.iinfo(np.int16).max).any():
+        raise ValueError("Preference ranks are out of range")
+    
+    out_of_range = int((((filled < 1) | (filled > n_faculties)) & ~blank).sum())
+    
+    return filled.astype(np.int16), blank, out_of_range
+
+
+def narrow_rank_block(ranks: np.ndarray, faculties: List[str], index: 'pd.Index') -> 'pd.DataFrame':
+    """
+    Validate a float rank block and narrow it to int16 columns
+    
+    Args:
+        ranks: float matrix (student x faculty), NaN for blank preferences
+        faculties: Faculty names for the columns
+        index: Row index for the result
+    
+    Returns:
+        pd.DataFrame: int16 rank columns, nullable Int16 where a column has blanks
+    """
+    import pandas as pd
+    
+    narrowed, blank, out_of_range = validate_rank_block(ranks, len(faculties))
+    if out_of_range:
+        logger.warning("%s preference ranks are outside 1..%s and will be ignored", out_of_range, len(faculties))
+    
+    if not blank.any():
+        return pd.DataFrame(narrowed, columns=faculties, index=index)
+    
+    return pd.DataFrame({
+        faculty: pd.arrays.IntegerArray(narrowed[:, col].copy(), blank[:, col].copy()) if blank[:, col].any() else narrowed[:, col]
+        for col, faculty in enumerate(faculties)
+    }, index=index)
+
+
+def _count_lines(file_path) -> Optional[int]:
+    """
+    Count newline-terminated lines in a file without parsing it
+    
+    Args:
+        file_path: Path of the file; file-like objects are not counted
+    
+    Returns:
+        Optional[int]: Line count, or None for file-like objects
+    """
+    if hasattr(file_path, 'read'):
+        return None
+    
+    lines = 0
+    with open(file_path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            lines += block.count(b'\n')
+    return lines + 1
+
+
+def read_students_chunked(file_path, chunksize: int = 50000) -> Tuple['pd.DataFrame', List[str], np.ndarray]:
+    """
+    Stream a student preference CSV in blocks into a preallocated rank matrix
+    
+    Each chunk's ranks are validated and copied into one int16 matrix (sized
+    from a raw newline count, or grown by doubling for file-like input);
+    only the identity columns are kept per chunk. Blank preferences become
+    rank 0, which never matches a faculty, so allocation and statistics are
+    the same as with read_students_csv. The ranks are returned as the matrix
+    itself (see AllocationEngine.rank_matrix), so no wide frame is ever built.
+    
+    Args:
+        file_path: Path or file-like object of the input CSV
+        chunksize: Rows per block
+    
+    Returns:
+        Tuple[pd.DataFrame, List[str], np.ndarray]: Identity columns (Roll,
+        Name, Email, CGPA, ...), faculty names and the int16 rank matrix
+    """
+    import pandas as pd
+    
+    header = pd.read_csv(file_path, nrows=0)
+    if hasattr(file_path, 'seek'):
+        file_path.seek(0)
+    dtypes, faculties = infer_schema(list(header.columns))
+    identity_columns = [col for col in header.columns if col not in faculties]
+    
+    capacity = _count_lines(file_path) or chunksize
+    ranks = np.zeros((capacity, len(faculties)), dtype=np.int16)
+    identity_chunks = []
+    n_rows = 0
+    out_of_range = 0
+    
+    try:
+        for chunk in pd.read_csv(file_path, dtype=dtypes, chunksize=chunksize):
+            narrowed, _, chunk_out_of_range = validate_rank_block(
+                chunk[faculties].to_numpy(dtype=np.float32), len(faculties))
+            
+            if n_rows + len(chunk) > ranks.shape[0]:
+                grown = np.zeros((max(2 * ranks.shape[0], n_rows + len(chunk)), len(faculties)), dtype=np.int16)
+                grown[:n_rows] = ranks[:n_rows]
+                ranks = grown
+            
+            ranks[n_rows:n_rows + len(chunk)] = narrowed
+            identity_chunks.append(chunk[identity_columns].reset_index(drop=True))
+            n_rows += len(chunk)
+            out_of_range += chunk_out_of_range
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Input does not match the expected schema (numeric CGPA and ranks): {e}")
+    
+    if out_of_range:
+        logger.warning("%s preference ranks are outside 1..%s and will be ignored", out_of_range, len(faculties))
+    
+    identity = pd.concat(identity_chunks, ignore_index=True) if identity_chunks else header[identity_columns]
+    if ranks.shape[0] != n_rows:
+        # Drop the spare rows in place (the newline count includes the header)
+        ranks.resize((n_rows, len(faculties)), refcheck=False)
+    
+    return identity, faculties, ranks
+
+
+def apply_student_updates(students_data: 'pd.DataFrame', faculties: List[str], positions: np.ndarray,
+                          changed: 'pd.DataFrame') -> 'pd.DataFrame':
+    """
+    Copy of the student data with some rows replaced by edited values
+    
+    Args:
+        students_data: Parsed student data
+        faculties: Faculty names
+        positions: Row positions in students_data, aligned with the rows of changed
+        changed: Edited rows; Roll plus any subset of the other input columns
+    
+    Returns:
+        pd.DataFrame: Updated student data (students_data is not modified)
+    """
+    import pandas as pd
+    
+    unknown = [column for column in changed.columns if column not in students_data.columns]
+    if unknown:
+        raise ValueError(f"Unknown columns in student updates: {unknown}")
+    
+    updated = students_data.copy()
+    for column in changed.columns:
+        if column == 'Roll':
+            continue
+        
+        if column in faculties:
+            ranks, blank, _ = validate_rank_block(changed[[column]].to_numpy(dtype=np.float64, na_value=np.nan),
+                                                  len(faculties))
+            values = pd.arrays.IntegerArray(ranks[:, 0], blank[:, 0])
+            if blank.any() and not isinstance(updated[column].dtype, pd.Int16Dtype):
+                updated[column] = updated[column].astype('Int16')
+        else:
+            values = changed[column].to_numpy()
+        
+        updated.iloc[positions, updated.columns.get_loc(column)] = values
+    
+    return updated
+
+
+# Bump when the parsed representation changes so old sidecars are rebuilt
+CACHE_VERSION = 1
+CACHE_SUFFIX = '.alloc-cache.arrow'
+_CACHE_METADATA_KEY = b'allocation_cache'
+
+
+def cache_path_for(file_path: str, cache_dir: Optional[str] = None) -> str:
+    """
+    Location of the binary sidecar for an input CSV
+    
+    Args:
+        file_path: Path of the input CSV
+        cache_dir: Optional directory for sidecars, defaults to next to the CSV
+    
+    Returns:
+        str: Sidecar path
+    """
+    if cache_dir is None:
+        return file_path + CACHE_SUFFIX
+    return os.path.join(cache_dir, os.path.basename(file_path) + CACHE_SUFFIX)
+
+
+def file_digest(file_path: str) -> str:
+    """
+    Content hash of a file (BLAKE2b)
+    
+    Args:
+        file_path: Path of the file
+    
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_digest(data: bytes) -> str:
+    """
+    Content hash of in-memory file contents, e.g. an upload; equal to
+    file_digest of the same bytes on disk
+    
+    Args:
+        data: File contents
+    
+    Returns:
+        str: Hex digest
+    """
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def load_students_cache(file_path: str, cache_dir: Optional[str] = None) -> Optional[Tuple['pd.DataFrame', List[str]]]:
+    """
+    Load parsed student data from the sidecar if it matches the CSV
+    
+    The sidecar is an uncompressed Arrow IPC file read through a memory map.
+    Blocks are not consolidated, so numeric columns without blanks (int16
+    ranks, CGPA) are read-only views of the map rather than copies; string
+    columns and nullable rank columns are converted. Neither parsing nor
+    validation runs again. It is only used when the CSV size, modification time and
+    content hash all match what was recorded when it was written.
+    
+    Args:
+        file_path: Path of the input CSV
+        cache_dir: Optional directory for sidecars
+    
+    Returns:
+        Optional[Tuple[pd.DataFrame, List[str]]]: Student data and faculty
+        names, or None if there is no usable sidecar
+    """
+    sidecar = cache_path_for(file_path, cache_dir)
+    if not os.path.exists(sidecar):
+        return None
+    
+    try:
+        from pyarrow import feather
+    except ImportError:
+        return None
+    
+    try:
+        table = feather.read_table(sidecar, memory_map=True)
+        metadata = json.loads(table.schema.metadata[_CACHE_METADATA_KEY])
+        
+        source = os.stat(file_path)
+        if (metadata['version'] != CACHE_VERSION or metadata['size'] != source.st_size
+                or metadata['mtime_ns'] != source.st_mtime_ns or metadata['digest'] != file_digest(file_path)):
+            logger.info("Ignoring stale cache %s", sidecar)
+            return None
+        
+        logger.info("Loaded parsed input from cache %s", sidecar)
+        return table.to_pandas(split_blocks=True), metadata['faculties']
+    
+    except Exception as e:
+        logger.warning("Could not read cache %s: %s", sidecar, e)
+        return None
+
+
+def write_students_cache(file_path: str, students_data: 'pd.DataFrame', faculties: List[str],
+                         cache_dir: Optional[str] = None, ranks: Optional[np.ndarray] = None) -> bool:
+    """
+    Write parsed student data to the sidecar of its CSV
+    
+    Args:
+        file_path: Path of the input CSV
+        students_data: Parsed and validated student data
+        faculties: Faculty names
+        cache_dir: Optional directory for sidecars, created if missing
+        ranks: Rank matrix when students_data holds only the identity
+            columns (see read_students_chunked); stored as faculty columns
+    
+    Returns:
+        bool: True if the sidecar was written, False otherwise
+    """
+    try:
+        import pyarrow
+        from pyarrow import feather
+    except ImportError:
+        logger.warning("pyarrow is not installed, input caching is disabled")
+        return False
+    
+    sidecar = cache_path_for(file_path, cache_dir)
+    try:
+        source = os.stat(file_path)
+        metadata = {
+            'version': CACHE_VERSION,
+            'size': source.st_size,
+            'mtime_ns': source.st_mtime_ns,
+            'digest': file_digest(file_path),
+            'faculties': faculties
+        }
+        
+        table = pyarrow.Table.from_pandas(students_data, preserve_index=False)
+        if ranks is not None:
+            for col, faculty in enumerate(faculties):
+                table = table.append_column(faculty, pyarrow.array(ranks[:, col]))
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               _CACHE_METADATA_KEY: json.dumps(metadata).encode()})
+        
+        # Write to a temporary file first so readers never see a partial sidecar
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        temporary = sidecar + '.tmp'
+        feather.write_feather(table, temporary, compression='uncompressed')
+        os.replace(temporary, sidecar)
+        
+        logger.info("Cached parsed input to %s", sidecar)
+        return True
+    
+    except Exception as e:
+        logger.warning("Could not write cache %s: %s", sidecar, e)
+        return False
+
+
+def write_snapshot(path: str, arrays: Dict[str, np.ndarray]) -> None:
+    """
+    Write allocator state arrays to an uncompressed .npz file
+    
+    Args:
+        path: Destination path
+        arrays: Named arrays, e.g. CycleAllocator.snapshot()
+    """
+    # Write to a temporary file first so a crash mid-write keeps the previous snapshot
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as handle:
+        np.savez(handle, **arrays)
+    os.replace(temporary, path)
+
+
+def read_snapshot(path: str) -> Dict[str, np.ndarray]:
+    """
+    Read allocator state arrays written by write_snapshot
+    
+    Args:
+        path: Snapshot path
+    
+    Returns:
+        Dict[str, np.ndarray]: Named arrays
+    """
+    with np.load(path, allow_pickle=False) as snapshot:
+        return {name: snapshot[name] for name in snapshot.files}
+
+
+RANK_MATRIX_DTYPE = np.int16
+
+
+def write_rank_matrix(path: str, ranks: np.ndarray) -> None:
+    """
+    Save an int16 rank matrix (student x faculty, 0 for blanks) as a .npy file
+    
+    Args:
+        path: Destination .npy path
+        ranks: Rank matrix in students_data row order
+    """
+    # Write to a temporary file first so workers never map a partial matrix
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as handle:
+        np.save(handle, np.ascontiguousarray(ranks, dtype=RANK_MATRIX_DTYPE))
+    os.replace(temporary, path)
+
+
+def open_rank_matrix(path: str, shape: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """
+    Open a rank matrix written by write_rank_matrix as a read-only memory map
+    
+    Pages are shared through the OS page cache, so any number of processes
+    can map the same file without each holding a private copy.
+    
+    Args:
+        path: Path of the .npy file
+        shape: Expected (n_students, n_faculties), checked if given
+    
+    Returns:
+        np.ndarray: Read-only int16 memory map
+    """
+    ranks = np.load(path, mmap_mode='r')
+    if ranks.dtype != RANK_MATRIX_DTYPE or ranks.ndim != 2:
+        raise ValueError(f"{path} is not an int16 rank matrix (dtype {ranks.dtype}, {ranks.ndim} dimensions)")
+    if shape is not None and ranks.shape != tuple(shape):
+        raise ValueError(f"Rank matrix {path} has shape {ranks.shape}, expected {tuple(shape)}")
+    return ranks
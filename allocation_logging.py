@@ -0,0 +1,108 @@
+"""
+BTP/MTP Allocation Logging
+Entry point logging setup, with non-blocking file logging through a queue so
+engine runs never wait on disk I/O
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+from typing import Dict, Optional, Tuple
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Running listeners and the queue handlers that feed them
+_listeners: Dict[logging.handlers.QueueListener, Tuple[logging.Logger, logging.handlers.QueueHandler]] = {}
+
+
+def start_queue_logging(log_path: str, level: int = logging.INFO, logger: Optional[logging.Logger] = None,
+                        fmt: str = LOG_FORMAT) -> logging.handlers.QueueListener:
+    """
+    Send records to a file from a background thread
+    
+    The calling thread only puts records on an unbounded queue; a
+    QueueListener thread formats them and writes the file. Stopped
+    automatically at interpreter exit, which flushes pending records.
+    The logger's own level still applies, as for any handler.
+    
+    Args:
+        log_path: Log file (appended to)
+        level: Minimum level written to the file
+        logger: Logger to attach to (defaults to the root logger)
+        fmt: Record format
+    
+    Returns:
+        logging.handlers.QueueListener: Pass to stop_queue_logging to detach early
+    """
+    file_handler = logging.FileHandler(log_path)
+    file_handler.setFormatter(logging.Formatter(fmt))
+    file_handler.setLevel(level)
+    
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.setLevel(level)
+    listener = logging.handlers.QueueListener(records, file_handler, respect_handler_level=True)
+    listener.start()
+    
+    target = logger or logging.getLogger()
+    target.addHandler(queue_handler)
+    _listeners[listener] = (target, queue_handler)
+    return listener
+
+
+def stop_queue_logging(listener: logging.handlers.QueueListener) -> None:
+    """
+    Detach a queue sink, write out pending records and close its file
+    
+    Args:
+        listener: Listener returned by start_queue_logging
+    """
+    target, queue_handler = _listeners.pop(listener, (None, None))
+    if target is None:
+        return
+    target.removeHandler(queue_handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def configure_logging(log_file: Optional[str] = None, level: int = logging.INFO, fmt: str = LOG_FORMAT,
+                      console_level: Optional[int] = None) -> Optional[logging.handlers.QueueListener]:
+    """
+    Console logging plus an optional queued log file, for entry points
+    
+    Library modules only create loggers; scripts call this once at startup.
+    Like logging.basicConfig it does nothing if the root logger already has
+    handlers, so it is safe in scripts that rerun in one process (Streamlit).
+    
+    Args:
+        log_file: Log file to append to through start_queue_logging
+        level: Minimum level logged (to the file, and to the console unless
+            console_level is given)
+        fmt: Record format
+        console_level: Separate console level, e.g. a quieter console next
+            to a detailed log file
+    
+    Returns:
+        Optional[logging.handlers.QueueListener]: The log file's listener
+        (pass to stop_queue_logging to detach it early), or None if no file
+        was set up
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+    console_level = level if console_level is None else console_level
+    console = logging.StreamHandler()
+    console.setLevel(console_level)
+    logging.basicConfig(level=min(level, console_level) if log_file else console_level, format=fmt,
+                        handlers=[console])
+    if log_file:
+        return start_queue_logging(log_file, level, fmt=fmt)
+    return None
+
+
+@atexit.register
+def _stop_all() -> None:
+    for listener in list(_listeners):
+        stop_queue_logging(listener)
@@ -0,0 +1,403 @@
+"""
+BTP/MTP Allocation Metrics
+Per-phase timers and counters collected by AllocationEngine, and a
+process-wide registry exported in the Prometheus text format
+"""
+
+import bisect
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets: seconds for latencies, bytes for uploads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class EngineMetrics:
+    """Timers and counters for one engine, exposed as a JSON-friendly dict"""
+    
+    def __init__(self):
+        # Seconds of the latest call, cumulative seconds and call count per phase
+        self.timings: Dict[str, float] = {}
+        self.totals: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, object] = {}
+    
+    def record_phase(self, phase: str, seconds: float) -> None:
+        """
+        Record one timed call of a phase
+        
+        Args:
+            phase: Phase name, e.g. 'load' or 'allocation'
+            seconds: Wall-clock duration
+        """
+        self.timings[phase] = seconds
+        self.totals[phase] = self.totals.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        record_engine_phase(phase, seconds)
+    
+    def set_counters(self, **counters) -> None:
+        """Set or replace named counters"""
+        self.counters.update(counters)
+    
+    def as_dict(self) -> Dict:
+        """
+        Snapshot of all metrics
+        
+        Returns:
+            Dict: timings, totals and calls per phase, plus counters
+        """
+        return {
+            'timings': dict(self.timings),
+            'totals': dict(self.totals),
+            'calls': dict(self.calls),
+            'counters': dict(self.counters)
+        }
+    
+    def to_json(self) -> str:
+        """Metrics as a JSON string"""
+        return json.dumps(self.as_dict())
+    
+    def save(self, output_path: str) -> bool:
+        """
+        Append the current metrics as one JSON line, so a file collects a
+        series of runs for charting
+        
+        Args:
+            output_path: Metrics file (JSON Lines)
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            record = {'timestamp': time.time(), **self.as_dict()}
+            with open(output_path, 'a') as handle:
+                handle.write(json.dumps(record) + '\n')
+            return True
+        
+        except Exception as e:
+            logger.error("Error saving metrics: %s", e)
+            return False
+
+
+def timed_phase(phase: str) -> Callable:
+    """
+    Decorator for engine methods that records their duration as a phase
+    
+    Nested phases are timed independently, so e.g. 'allocation' includes
+    the 'sort' it triggers.
+    
+    Args:
+        phase: Phase name
+    
+    Returns:
+        Callable: Method decorator
+    """
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.metrics.record_phase(phase, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms for a long-running process (the
+    Streamlit service), rendered in the Prometheus text exposition format
+    
+    Metrics are keyed by name plus label values and created on first use,
+    so callers need no registration step. Updates take a lock; they happen
+    once per run or phase, not per row.
+    """
+    
+    def __init__(self, prefix: str = 'btp_'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # name -> (type, help text)
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._values: Dict[str, Dict[Tuple, float]] = {}
+        # name -> buckets; histogram series hold [bucket counts..., sum, count]
+        self._buckets: Dict[str, Sequence[float]] = {}
+    
+    def _series(self, kind: str, name: str, help_text: str, labels: Dict[str, str]) -> Tuple[Dict, Tuple]:
+        name = self.prefix + name
+        if name not in self._meta:
+            self._meta[name] = (kind, help_text)
+            self._values[name] = {}
+        elif self._meta[name][0] != kind:
+            raise ValueError(f"Metric {name} is a {self._meta[name][0]}, not a {kind}")
+        key = tuple(sorted((label, str(value)) for label, value in labels.items()))
+        return self._values[name], key
+    
+    def inc(self, name: str, amount: float = 1.0, help_text: str = '', **labels) -> None:
+        """Increase a counter (created at zero)"""
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            series, key = self._series('counter', name, help_text, labels)
+            series[key] = series.get(key, 0.0) + amount
+    
+    def set(self, name: str, value: float, help_text: str = '', **labels) -> None:
+        """Set a gauge"""
+        with self._lock:
+            series, key = self._series('gauge', name, help_text, labels)
+            series[key] = float(value)
+    
+    def set_max(self, name: str, value: float, help_text: str = '', **labels) -> None:
+        """Raise a gauge to value if it is higher (a high-water mark)"""
+        with self._lock:
+            series, key = self._series('gauge', name, help_text, labels)
+            series[key] = max(series.get(key, float(value)), float(value))
+    
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS,
+                help_text: str = '', **labels) -> None:
+        """
+        Add one observation to a histogram
+        
+        Args:
+            name: Metric name without the registry prefix
+            value: Observed value (seconds, bytes, ...)
+            buckets: Upper bounds, used when the histogram is first created
+            help_text: HELP line for the exposition output
+            **labels: Label values
+        """
+        with self._lock:
+            series, key = self._series('histogram', name, help_text, labels)
+            bounds = self._buckets.setdefault(self.prefix + name, tuple(buckets))
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [0] * len(bounds) + [0.0, 0]
+            # Buckets are stored non-cumulatively and summed when rendered
+            index = bisect.bisect_left(bounds, value)
+            if index < len(bounds):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+    
+    def value(self, name: str, **labels) -> Optional[float]:
+        """
+        Current value of a counter or gauge, or the observation count of a
+        histogram; None if the series does not exist
+        """
+        with self._lock:
+            series = self._values.get(self.prefix + name, {})
+            state = series.get(tuple(sorted((label, str(v)) for label, v in labels.items())))
+        if isinstance(state, list):
+            return state[-1]
+        return state
+    
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format (version 0.0.4)
+        
+        Returns:
+            str: Exposition text, newline-terminated
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(self._meta):
+                kind, help_text = self._meta[name]
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, state in sorted(self._values[name].items()):
+                    if kind != 'histogram':
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(state)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self._buckets[name], state):
+                        cumulative += count
+                        bucket_key = key + (('le', _format_value(bound)),)
+                        lines.append(f"{name}_bucket{_format_labels(bucket_key)} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {state[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(state[-2])}")
+                    lines.append(f"{name}_count{_format_labels(key)} {state[-1]}")
+        return '\n'.join(lines) + '\n'
+    
+    def write_textfile(self, output_path: str) -> bool:
+        """
+        Write the exposition text atomically, e.g. for the node_exporter
+        textfile collector (the file name must end in .prom)
+        
+        Args:
+            output_path: Destination file
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            temp_path = f"{output_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as handle:
+                handle.write(self.render())
+            os.replace(temp_path, output_path)
+            return True
+        
+        except Exception as e:
+            logger.error("Error writing metrics textfile: %s", e)
+            return False
+    
+    def reset(self) -> None:
+        """Drop all metrics"""
+        with self._lock:
+            self._meta.clear()
+            self._values.clear()
+            self._buckets.clear()
+
+
+# Registry shared by the engine phases and the Streamlit app
+REGISTRY = MetricsRegistry()
+
+_servers: Dict[Tuple[str, int], 'ThreadingHTTPServer'] = {}
+_servers_lock = threading.Lock()
+
+
+def peak_memory_bytes() -> Optional[int]:
+    """
+    Peak resident set size of this process, or None where the resource
+    module is unavailable
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def record_engine_phase(phase: str, seconds: float) -> None:
+    """Export one engine phase duration through the shared registry"""
+    REGISTRY.observe('engine_phase_seconds', seconds, help_text='Duration of engine phases', phase=phase)
+
+
+def record_error(stage: str, error: BaseException, registry: Optional[MetricsRegistry] = None) -> None:
+    """
+    Count a failure
+    
+    Args:
+        stage: Where it happened, e.g. 'upload' or 'allocation'
+        error: The exception; its class name becomes a label
+        registry: Target registry (defaults to REGISTRY)
+    """
+    (registry or REGISTRY).inc('errors_total', help_text='Failures by stage and error type',
+                               stage=stage, error=type(error).__name__)
+
+
+@contextmanager
+def track_run(rows: int, upload_bytes: Optional[int] = None,
+              registry: Optional[MetricsRegistry] = None) -> Iterator[None]:
+    """
+    Record one allocation run: latency, rows processed per second, upload
+    size, memory high-water mark, and an error count if the block raises
+    
+    Args:
+        rows: Number of students in the run
+        upload_bytes: Size of the uploaded file, if any
+        registry: Target registry (defaults to REGISTRY)
+    """
+    registry = registry or REGISTRY
+    if upload_bytes is not None:
+        registry.observe('upload_size_bytes', upload_bytes, buckets=SIZE_BUCKETS, help_text='Uploaded file sizes')
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'success'
+    except Exception as e:
+        record_error('allocation', e, registry)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe('allocation_run_seconds', seconds, help_text='End-to-end allocation run latency',
+                         outcome=outcome)
+        registry.inc('allocation_runs_total', help_text='Allocation runs by outcome', outcome=outcome)
+        if outcome == 'success':
+            registry.inc('rows_processed_total', rows, help_text='Student rows allocated')
+            if seconds > 0:
+                registry.set('rows_per_second', rows / seconds, help_text='Throughput of the latest run')
+        peak = peak_memory_bytes()
+        if peak is not None:
+            registry.set_max('memory_peak_bytes', peak, help_text='Process peak resident set size')
+
+
+def start_http_server(port: int, addr: str = '0.0.0.0', registry: Optional[MetricsRegistry] = None
+                      ) -> 'ThreadingHTTPServer':
+    """
+    Serve /metrics from a daemon thread
+    
+    Idempotent per address, so a Streamlit script that reruns on every
+    interaction starts the server only once per process.
+    
+    Args:
+        port: TCP port (0 picks a free port)
+        addr: Bind address
+        registry: Registry to expose (defaults to REGISTRY)
+    
+    Returns:
+        ThreadingHTTPServer: The running server
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    registry = registry or REGISTRY
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would flood stderr
+            pass
+    
+    with _servers_lock:
+        server = _servers.get((addr, port))
+        if server is None:
+            server = ThreadingHTTPServer((addr, port), MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name='metrics-exporter', daemon=True).start()
+            _servers[(addr, port)] = server
+            logger.info("Serving metrics on http://%s:%s/metrics", addr, server.server_address[1])
+        return server
@@ -0,0 +1,1020 @@
+"""
+BTP/MTP Allocation Strategies
+Registry of allocation algorithms that run on a shared preprocessed cohort
+"""
+
+import hashlib
+import heapq
+import logging
+import os
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from allocation_io import RANK_MATRIX_DTYPE, read_snapshot, write_snapshot
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedCohort:
+    """Preprocessed allocation input shared by every strategy"""
+    
+    def __init__(self, students: 'pd.DataFrame', faculties: List[str], preference_order: np.ndarray):
+        """
+        Args:
+            students: Student data sorted by CGPA (allocation order)
+            faculties: Faculty names in column order
+            preference_order: int16 matrix (student x rank -> faculty index, -1 if unranked)
+        """
+        self.students = students
+        self.faculties = list(faculties)
+        self.preference_order = preference_order
+        # Frame (and memory-mapped rank matrix, if any) the cohort was prepared from, used to detect stale caches
+        self.source = None
+        self.rank_source = None
+        # Row positions of the students in the source frame
+        self.positions = None
+        # CycleAllocator of the last 'cycle' run, kept for incremental updates
+        self.allocator = None
+        # Explicit per-faculty seat limits (int32 arrays); None means the mod n default
+        self.max_capacity = None
+        self.min_capacity = None
+    
+    @property
+    def n_students(self) -> int:
+        return self.preference_order.shape[0]
+    
+    @property
+    def n_faculties(self) -> int:
+        return len(self.faculties)
+    
+    def default_capacities(self) -> np.ndarray:
+        """
+        Per-faculty capacity implied by the mod n rule: ceil(students / faculties)
+        
+        Returns:
+            np.ndarray: int32 capacity per faculty
+        """
+        per_faculty = -(-self.n_students // max(self.n_faculties, 1))
+        return np.full(self.n_faculties, per_faculty, dtype=np.int32)
+    
+    def capacities(self) -> np.ndarray:
+        """
+        Maximum seats per faculty: the explicit limits if set, else the mod n default
+        
+        Returns:
+            np.ndarray: int32 capacity per faculty
+        """
+        if self.max_capacity is not None:
+            return self.max_capacity
+        return self.default_capacities()
+
+
+StrategyFunction = Callable[..., Tuple[np.ndarray, np.ndarray]]
+
+STRATEGIES: Dict[str, StrategyFunction] = {}
+
+# Rows per block when processing whole rank matrices, bounding temporaries
+RANK_BLOCK_ROWS = 8192
+
+
+def register_strategy(name: str) -> Callable[[StrategyFunction], StrategyFunction]:
+    """
+    Register an allocation strategy under the given name
+    
+    A strategy takes a PreparedCohort plus optional keyword options and
+    returns the allocated faculty index (int32) and preference rank (int16,
+    0 for fallback assignments) per student, in the cohort's row order.
+    
+    Args:
+        name: Strategy name used by AllocationEngine(strategy=...)
+    
+    Returns:
+        Callable: Decorator that registers the function
+    """
+    def decorator(func: StrategyFunction) -> StrategyFunction:
+        STRATEGIES[name] = func
+        return func
+    return decorator
+
+
+def get_strategy(name: str) -> StrategyFunction:
+    """
+    Look up a registered allocation strategy
+    
+    Args:
+        name: Strategy name
+    
+    Returns:
+        StrategyFunction: The registered strategy
+    """
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown allocation strategy '{name}'. Available: {sorted(STRATEGIES)}")
+    return STRATEGIES[name]
+
+
+def rank_block_from_frame(students: 'pd.DataFrame', faculties: List[str],
+                          positions: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Faculty rank columns of a student frame as an int16 matrix
+    
+    Columns are converted one at a time, so the only full-size allocation is
+    the int16 result: integer columns (int16 from the typed loaders, or
+    nullable Int) never go through float64. Blanks and anything that is not
+    a whole rank in 1..len(faculties) become 0, as in saved rank matrices.
+    
+    Args:
+        students: Student data with the faculty rank columns
+        faculties: Faculty column names
+        positions: Optional row positions to take, e.g. the allocation order
+    
+    Returns:
+        np.ndarray: int16 matrix (student x faculty), 0 where not a valid rank
+    """
+    n_rows = len(students) if positions is None else len(positions)
+    ranks = np.empty((n_rows, len(faculties)), dtype=RANK_MATRIX_DTYPE)
+    for col, faculty in enumerate(faculties):
+        column = students[faculty]
+        if column.dtype.kind in 'iu':
+            values = column.to_numpy(dtype=np.int64, na_value=0)
+        else:
+            values = column.to_numpy(dtype=np.float64, na_value=np.nan)
+        if positions is not None:
+            values = values[positions]
+        ranks[:, col] = np.where(valid_rank_mask(values, len(faculties)), values, 0)
+    return ranks
+
+
+def valid_rank_mask(ranks: np.ndarray, n_faculties: int) -> np.ndarray:
+    """
+    Mask of the entries of a rank block that are whole ranks in 1..n_faculties
+    
+    Args:
+        ranks: Rank matrix (student x faculty), float with NaN for blanks or
+            integer with 0 for blanks
+        n_faculties: Number of faculties
+    
+    Returns:
+        np.ndarray: Boolean mask of the same shape
+    """
+    valid = (ranks >= 1) & (ranks <= n_faculties)
+    if np.issubdtype(ranks.dtype, np.floating):
+        valid &= ranks == np.floor(ranks)
+    return valid
+
+
+def preference_order_from_ranks(ranks: np.ndarray, n_faculties: int, positions: Optional[np.ndarray] = None,
+                                block_rows: int = RANK_BLOCK_ROWS) -> np.ndarray:
+    """
+    Build the preference order matrix (student x rank -> faculty index)
+    
+    Entry [i, k] is the faculty column that student i ranked k + 1, or -1 if
+    no faculty carries that rank. If a rank is repeated, the first faculty
+    column holding it wins.
+    
+    Rows are processed in blocks, so besides the int16 result only
+    block-sized temporaries are allocated, whatever the cohort size.
+    
+    Args:
+        ranks: Rank matrix (student x faculty); any numeric dtype, including a
+            read-only memory map. int16 input is used as is.
+        n_faculties: Number of faculties
+        positions: Rows of ranks in allocation order; None if ranks is
+            already in allocation order
+        block_rows: Rows per block
+    
+    Returns:
+        np.ndarray: int16 matrix of shape (n_students, n_faculties)
+    """
+    n_students = ranks.shape[0] if positions is None else len(positions)
+    preference_order = np.empty((n_students, n_faculties), dtype=np.int16)
+    for start in range(0, n_students, block_rows):
+        stop = min(start + block_rows, n_students)
+        block = ranks[start:stop] if positions is None else ranks[positions[start:stop]]
+        preference_order[start:stop] = _preference_order_block(block, n_faculties)
+    return preference_order
+
+
+def _preference_order_block(ranks: np.ndarray, n_faculties: int) -> np.ndarray:
+    """Preference order of one block of rows (see preference_order_from_ranks)"""
+    # Anything that is not a whole rank in 1..n_faculties never matches; map it past the end
+    rank_keys = np.where(valid_rank_mask(ranks, n_faculties), ranks, n_faculties + 1).astype(np.int16, copy=False)
+    
+    # Stable argsort (radix sort on int16) keeps equal ranks in faculty column order
+    order = np.argsort(rank_keys, axis=1, kind='stable')
+    sorted_ranks = np.take_along_axis(rank_keys, order, axis=1)
+    
+    keep = sorted_ranks <= n_faculties
+    keep[:, 1:] &= sorted_ranks[:, 1:] != sorted_ranks[:, :-1]
+    
+    # Scatter each kept faculty to its rank slot; dropped entries land in a spare last column
+    preference_order = np.full((ranks.shape[0], n_faculties + 1), -1, dtype=np.int16)
+    target = np.where(keep, sorted_ranks - 1, n_faculties)
+    np.put_along_axis(preference_order, target, order.astype(np.int16), axis=1)
+    
+    return preference_order[:, :n_faculties]
+
+
+class CycleAllocator:
+    """
+    Resumable mod n cycle allocation over a preference order matrix
+    
+    Students are taken in row order; student i belongs to cycle i // n_faculties
+    and gets the first preferred faculty that has not yet taken a student in
+    that cycle. Students with no such faculty fall back to the least loaded
+    faculty (first in column order on ties).
+    
+    With explicit capacities a full faculty is skipped, a faculty that
+    missed a cycle may catch up later, and fallback only picks faculties
+    with a free seat.
+    
+    The per-faculty counters are checkpointed at every cycle boundary. They
+    are the whole allocator state there, so a run can be restarted from any
+    boundary it has passed without replaying the prefix.
+    """
+    
+    def __init__(self, preference_order: np.ndarray, n_faculties: int, capacities: Optional[np.ndarray] = None):
+        """
+        Args:
+            preference_order: int16 matrix (student x rank -> faculty index, -1 if unranked)
+            n_faculties: Number of faculties
+            capacities: Optional seats per faculty
+        """
+        n_students = preference_order.shape[0]
+        self.preference_order = preference_order
+        self.n_faculties = n_faculties
+        self.position = 0
+        self.allocated = np.full(n_students, -1, dtype=np.int32)
+        self.preference_rank = np.zeros(n_students, dtype=np.int16)
+        
+        # The extra trailing slot is what -1 (unranked) indexes; its count never
+        # equals a cycle or fits under a seat limit, so unranked positions never match
+        self.faculty_cycle_count = np.zeros(n_faculties + 1, dtype=np.int32)
+        self.faculty_cycle_count[n_faculties] = np.iinfo(np.int32).max
+        self.seats = None if capacities is None else np.append(np.asarray(capacities, dtype=np.int32), 0)
+        
+        # Row c holds faculty_cycle_count at the start of cycle c (student c * n_faculties)
+        self.checkpoints = np.zeros((-(-n_students // max(n_faculties, 1)), n_faculties), dtype=np.int32)
+        self._fingerprint = None
+    
+    @property
+    def n_students(self) -> int:
+        return self.preference_order.shape[0]
+    
+    def run(self, stop: Optional[int] = None, reference: Optional['CycleAllocator'] = None,
+            settle_after: int = 0) -> int:
+        """
+        Allocate students from the current position
+        
+        Args:
+            stop: Position to stop before, defaults to the end of the cohort
+            reference: A completed run over the same cohort whose rows from
+                settle_after onwards are unchanged; once a cycle boundary at
+                or after settle_after has the same counters, the rest of its
+                assignment is copied instead of recomputed
+            settle_after: First position from which reference rows match
+            
+        Returns:
+            int: Position reached
+        """
+        n_faculties = self.n_faculties
+        preference_order = self.preference_order
+        allocated = self.allocated
+        preference_rank = self.preference_rank
+        faculty_cycle_count = self.faculty_cycle_count
+        counts = faculty_cycle_count[:n_faculties]
+        seats = self.seats
+        checkpoints = self.checkpoints
+        stop = self.n_students if stop is None else min(stop, self.n_students)
+        fallback = LeastLoadedQueue(counts, None if seats is None else seats[:n_faculties])
+        
+        cycle_start = self.position
+        while cycle_start < stop:
+            current_cycle = cycle_start // n_faculties
+            if cycle_start == current_cycle * n_faculties:
+                checkpoints[current_cycle] = counts
+                if (reference is not None and cycle_start >= settle_after
+                        and np.array_equal(reference.checkpoints[current_cycle], counts)):
+                    self._adopt_tail(reference, cycle_start)
+                    return self.position
+            cycle_end = min((current_cycle + 1) * n_faculties, stop)
+            
+            for idx in range(cycle_start, cycle_end):
+                row = preference_order[idx]
+                if seats is None:
+                    open_slots = faculty_cycle_count[row] == current_cycle
+                else:
+                    row_counts = faculty_cycle_count[row]
+                    open_slots = (row_counts <= current_cycle) & (row_counts < seats[row])
+                position = int(open_slots.argmax())
+                
+                if open_slots[position]:
+                    faculty_idx = row[position]
+                    preference_rank[idx] = position + 1
+                else:
+                    faculty_idx = fallback.least_loaded()
+                
+                allocated[idx] = faculty_idx
+                faculty_cycle_count[faculty_idx] += 1
+            
+            cycle_start = cycle_end
+        
+        # Stopping on a boundary: record the checkpoint of the cycle not yet started,
+        # so snapshots and restart_from can resume there
+        if cycle_start < self.n_students and cycle_start % n_faculties == 0:
+            checkpoints[cycle_start // n_faculties] = counts
+        
+        self.position = cycle_start
+        return cycle_start
+    
+    def _adopt_tail(self, reference: 'CycleAllocator', start: int) -> None:
+        """Copy the assignment and checkpoints of reference from start (a cycle boundary) to the end"""
+        self.allocated[start:] = reference.allocated[start:]
+        self.preference_rank[start:] = reference.preference_rank[start:]
+        self.checkpoints[start // self.n_faculties:] = reference.checkpoints[start // self.n_faculties:]
+        self.faculty_cycle_count[:] = reference.faculty_cycle_count
+        self.position = reference.position
+    
+    def restart_from(self, position: int, preference_order: Optional[np.ndarray] = None) -> 'CycleAllocator':
+        """
+        New allocator resumed at the last cycle boundary at or before position
+        
+        Args:
+            position: First position whose input may differ from this run
+            preference_order: Preference order for the new run (same shape),
+                identical to this run's before position; defaults to this run's
+            
+        Returns:
+            CycleAllocator: Allocator ready to run() from the boundary
+        """
+        preference_order = self.preference_order if preference_order is None else preference_order
+        if preference_order.shape != self.preference_order.shape:
+            raise ValueError("Can only restart over a cohort of the same shape")
+        
+        cycle = min(position, self.position) // max(self.n_faculties, 1)
+        start = cycle * self.n_faculties
+        
+        restarted = CycleAllocator(preference_order, self.n_faculties,
+                                   None if self.seats is None else self.seats[:self.n_faculties])
+        restarted.allocated[:start] = self.allocated[:start]
+        restarted.preference_rank[:start] = self.preference_rank[:start]
+        restarted.checkpoints[:cycle] = self.checkpoints[:cycle]
+        if start < restarted.n_students:
+            restarted.faculty_cycle_count[:self.n_faculties] = self.checkpoints[cycle]
+        restarted.position = start
+        
+        return restarted
+    
+    def fingerprint(self) -> str:
+        """
+        Hash of the inputs the run depends on (preference order and seat limits)
+        
+        Returns:
+            str: Hex digest
+        """
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(np.ascontiguousarray(self.preference_order, dtype=np.int16).tobytes())
+            if self.seats is not None:
+                digest.update(self.seats.tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+    
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """
+        Compact allocator state: position, per-faculty counters, the
+        checkpoints reached so far (including the one at position when it is
+        a cycle boundary) and the partial assignment
+        
+        Returns:
+            Dict[str, np.ndarray]: Arrays for allocation_io.write_snapshot
+        """
+        n_passed = min(self.position // max(self.n_faculties, 1) + 1, len(self.checkpoints))
+        return {
+            'fingerprint': np.array(self.fingerprint()),
+            'position': np.array(self.position),
+            'faculty_cycle_count': self.faculty_cycle_count[:self.n_faculties],
+            'checkpoints': self.checkpoints[:n_passed],
+            'allocated': self.allocated[:self.position],
+            'preference_rank': self.preference_rank[:self.position]
+        }
+    
+    @classmethod
+    def from_snapshot(cls, state: Dict[str, np.ndarray], preference_order: np.ndarray, n_faculties: int,
+                      capacities: Optional[np.ndarray] = None) -> 'CycleAllocator':
+        """
+        Rebuild an allocator from a snapshot of a run over the same inputs
+        
+        Args:
+            state: Arrays from snapshot() / allocation_io.read_snapshot
+            preference_order: int16 matrix the run was started on
+            n_faculties: Number of faculties
+            capacities: Optional seats per faculty the run was started with
+            
+        Returns:
+            CycleAllocator: Allocator positioned where the snapshot was taken
+        """
+        allocator = cls(preference_order, n_faculties, capacities)
+        if str(state['fingerprint']) != allocator.fingerprint():
+            raise ValueError("Snapshot was taken for a different cohort or different seat limits")
+        
+        position = int(state['position'])
+        allocator.allocated[:position] = state['allocated']
+        allocator.preference_rank[:position] = state['preference_rank']
+        allocator.checkpoints[:len(state['checkpoints'])] = state['checkpoints']
+        allocator.faculty_cycle_count[:n_faculties] = state['faculty_cycle_count']
+        allocator.position = position
+        # Snapshots taken on a boundary may lack its checkpoint; it equals the counters there
+        if position < allocator.n_students and position % max(n_faculties, 1) == 0:
+            allocator.checkpoints[position // n_faculties] = state['faculty_cycle_count']
+        
+        return allocator
+
+
+def cycle_allocation_kernel(preference_order: np.ndarray, n_faculties: int,
+                            capacities: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Columnar mod n allocation over a preference order matrix (see CycleAllocator)
+    
+    Args:
+        preference_order: int16 matrix (student x rank -> faculty index, -1 if unranked)
+        n_faculties: Number of faculties
+        capacities: Optional seats per faculty
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Allocated faculty index (int32) and
+        preference rank (int16, 0 for fallback assignments) per student
+    """
+    allocator = CycleAllocator(preference_order, n_faculties, capacities)
+    allocator.run()
+    return allocator.allocated, allocator.preference_rank
+
+
+class LeastLoadedQueue:
+    """
+    Lazy min-heap of (load, faculty index) for fallback assignment
+    
+    Loads only ever grow, so heap entries can only be stale by being too
+    low. Callers update the shared load array directly in O(1); stale
+    entries are refreshed when they reach the top, which keeps each
+    fallback lookup at amortised O(log F). Ties go to the first faculty in
+    column order.
+    """
+    
+    def __init__(self, load: np.ndarray, capacities: Optional[np.ndarray] = None):
+        """
+        Args:
+            load: Students per faculty, updated in place by the caller
+            capacities: Optional seats per faculty; full faculties are dropped
+        """
+        self.load = load
+        self.capacities = capacities
+        self.heap = [(int(count), faculty_idx) for faculty_idx, count in enumerate(load.tolist())
+                     if capacities is None or count < capacities[faculty_idx]]
+        heapq.heapify(self.heap)
+    
+    def least_loaded(self) -> int:
+        """
+        Least loaded faculty with a free seat (least loaded overall once every
+        faculty is full)
+        
+        Returns:
+            int: Faculty index
+        """
+        heap = self.heap
+        while heap:
+            entry_load, faculty_idx = heap[0]
+            current_load = int(self.load[faculty_idx])
+            if self.capacities is not None and current_load >= self.capacities[faculty_idx]:
+                heapq.heappop(heap)
+            elif current_load != entry_load:
+                heapq.heapreplace(heap, (current_load, faculty_idx))
+            else:
+                return faculty_idx
+        
+        return int(self.load.argmin())
+
+
+def _assign_fallback(allocated: np.ndarray, load: np.ndarray, capacities: np.ndarray) -> None:
+    """
+    Give every still unallocated student (allocated == -1) the least loaded
+    faculty that has a free seat, first in column order on ties
+    
+    Args:
+        allocated: Faculty index per student, updated in place
+        load: Students per faculty so far, updated in place
+        capacities: Seats per faculty
+    """
+    fallback = LeastLoadedQueue(load, capacities)
+    for idx in np.flatnonzero(allocated < 0):
+        faculty_idx = fallback.least_loaded()
+        allocated[idx] = faculty_idx
+        load[faculty_idx] += 1
+
+
+@register_strategy('cycle')
+def cycle_strategy(cohort: PreparedCohort, snapshot_path: Optional[str] = None, snapshot_every: int = 100,
+                   resume: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mod n cycle: each faculty takes at most one student per cycle of n students
+    
+    With snapshot_path the allocator state is written there every
+    snapshot_every cycles and once more at the end; resume=True continues
+    from that snapshot if it was taken for the same inputs.
+    """
+    allocator = None
+    if resume and snapshot_path and os.path.exists(snapshot_path):
+        try:
+            allocator = CycleAllocator.from_snapshot(read_snapshot(snapshot_path), cohort.preference_order,
+                                                     cohort.n_faculties, cohort.max_capacity)
+            logger.info("Resuming allocation at student %s from %s", allocator.position, snapshot_path)
+        except (ValueError, KeyError, OSError) as e:
+            logger.warning("Ignoring snapshot %s: %s", snapshot_path, e)
+    if allocator is None:
+        allocator = CycleAllocator(cohort.preference_order, cohort.n_faculties, cohort.max_capacity)
+    
+    if snapshot_path:
+        step = max(snapshot_every, 1) * cohort.n_faculties
+        while allocator.position < allocator.n_students:
+            allocator.run(stop=allocator.position + step)
+            write_snapshot(snapshot_path, allocator.snapshot())
+    else:
+        allocator.run()
+    cohort.allocator = allocator
+    return allocator.allocated.copy(), allocator.preference_rank.copy()
+
+
+def tie_groups(cgpa: np.ndarray) -> np.ndarray:
+    """
+    Label runs of equal CGPA in allocation order
+    
+    Args:
+        cgpa: CGPA per student, sorted descending (missing values last)
+    
+    Returns:
+        np.ndarray: int64 group number per student, increasing along the order
+    """
+    cgpa = np.asarray(cgpa, dtype=np.float64)
+    same = (cgpa[1:] == cgpa[:-1]) | (np.isnan(cgpa[1:]) & np.isnan(cgpa[:-1]))
+    return np.concatenate([[0], np.cumsum(~same)]).astype(np.int64)
+
+
+def shuffle_within_groups(groups: np.ndarray, n_permutations: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Random allocation orders that only reorder students inside their tie group
+    
+    Args:
+        groups: Group number per position, from tie_groups
+        n_permutations: Number of orders to draw
+        rng: Random generator
+    
+    Returns:
+        np.ndarray: int64 matrix (permutation x position -> student row)
+    """
+    # Adding a uniform [0, 1) key keeps groups in order and shuffles within each
+    keys = groups + rng.random((n_permutations, groups.shape[0]))
+    return np.argsort(keys, axis=1)
+
+
+def cycle_batch_kernel(preference_order: np.ndarray, n_faculties: int, orders: np.ndarray,
+                       capacities: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Run the cycle allocation for many student orders at once
+    
+    Every order is stepped in lockstep, so each position costs a few array
+    operations over all orders instead of one Python iteration per order.
+    Each row gives the same result as CycleAllocator on
+    preference_order[order].
+    
+    Args:
+        preference_order: int16 matrix (student x rank -> faculty index, -1 if unranked)
+        n_faculties: Number of faculties
+        orders: Matrix (run x position -> student row)
+        capacities: Optional seats per faculty
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Allocated faculty index (int32) and
+        preference rank (int16, 0 for fallback) per run and position
+    """
+    n_runs, n_students = orders.shape
+    runs = np.arange(n_runs)
+    allocated = np.empty((n_runs, n_students), dtype=np.int32)
+    preference_rank = np.zeros((n_runs, n_students), dtype=np.int16)
+    
+    # Same unreachable trailing slot for -1 (unranked) as CycleAllocator
+    faculty_cycle_count = np.zeros((n_runs, n_faculties + 1), dtype=np.int32)
+    faculty_cycle_count[:, n_faculties] = np.iinfo(np.int32).max
+    seats = None if capacities is None else np.append(np.asarray(capacities, dtype=np.int32), 0)
+    
+    for idx in range(n_students):
+        current_cycle = idx // n_faculties
+        rows = preference_order[orders[:, idx]]
+        counts = faculty_cycle_count[runs[:, None], rows]
+        if seats is None:
+            open_slots = counts == current_cycle
+        else:
+            open_slots = (counts <= current_cycle) & (counts < seats[rows])
+        position = open_slots.argmax(axis=1)
+        matched = open_slots[runs, position]
+        faculty_idx = np.where(matched, rows[runs, position], 0).astype(np.int32)
+        
+        if not matched.all():
+            # Least loaded faculty (with a free seat if there is one), first in column order on ties
+            unmatched = ~matched
+            load = faculty_cycle_count[unmatched, :n_faculties]
+            if seats is None:
+                faculty_idx[unmatched] = load.argmin(axis=1)
+            else:
+                free = load < seats[:n_faculties]
+                least_free = np.where(free, load, np.iinfo(np.int32).max).argmin(axis=1)
+                faculty_idx[unmatched] = np.where(free.any(axis=1), least_free, load.argmin(axis=1))
+        
+        allocated[:, idx] = faculty_idx
+        preference_rank[:, idx] = np.where(matched, position + 1, 0)
+        faculty_cycle_count[runs, faculty_idx] += 1
+    
+    return allocated, preference_rank
+
+
+@register_strategy('serial_dictatorship')
+def serial_dictatorship_strategy(cohort: PreparedCohort) -> Tuple[np.ndarray, np.ndarray]:
+    """Students in CGPA order take their best faculty that still has a free seat"""
+    n_faculties = cohort.n_faculties
+    preference_order = cohort.preference_order
+    capacities = cohort.capacities()
+    
+    allocated = np.full(cohort.n_students, -1, dtype=np.int32)
+    preference_rank = np.zeros(cohort.n_students, dtype=np.int16)
+    
+    # The extra trailing slot is what -1 (unranked) indexes; it never has a free seat
+    remaining = np.append(capacities, 0).astype(np.int32)
+    
+    for idx in range(cohort.n_students):
+        open_slots = remaining[preference_order[idx]] > 0
+        position = int(open_slots.argmax())
+        
+        if open_slots[position]:
+            faculty_idx = preference_order[idx, position]
+            allocated[idx] = faculty_idx
+            preference_rank[idx] = position + 1
+            remaining[faculty_idx] -= 1
+    
+    load = (capacities - remaining[:n_faculties]).astype(np.int32)
+    _assign_fallback(allocated, load, capacities)
+    
+    return allocated, preference_rank
+
+
+@register_strategy('capacity_greedy')
+def capacity_greedy_strategy(cohort: PreparedCohort) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rank-by-rank greedy: fill every faculty from the students who ranked it
+    first (highest CGPA first), then second, and so on until seats run out
+    """
+    n_faculties = cohort.n_faculties
+    preference_order = cohort.preference_order
+    capacities = cohort.capacities()
+    
+    allocated = np.full(cohort.n_students, -1, dtype=np.int32)
+    preference_rank = np.zeros(cohort.n_students, dtype=np.int16)
+    remaining = capacities.copy()
+    
+    for position in range(n_faculties):
+        pending = np.flatnonzero(allocated < 0)
+        if not pending.size:
+            break
+        
+        choice = preference_order[pending, position]
+        ranked = choice >= 0
+        pending, choice = pending[ranked], choice[ranked]
+        
+        # Group by faculty; the stable sort keeps CGPA order inside each group
+        by_faculty = np.argsort(choice, kind='stable')
+        pending, choice = pending[by_faculty], choice[by_faculty]
+        seat = np.arange(choice.size) - np.searchsorted(choice, choice, side='left')
+        
+        accepted = seat < remaining[choice]
+        allocated[pending[accepted]] = choice[accepted]
+        preference_rank[pending[accepted]] = position + 1
+        remaining -= np.bincount(choice[accepted], minlength=n_faculties).astype(np.int32)
+    
+    load = (capacities - remaining).astype(np.int32)
+    _assign_fallback(allocated, load, capacities)
+    
+    return allocated, preference_rank
+
+
+def _rank_matrix(preference_order: np.ndarray) -> np.ndarray:
+    """
+    Invert the preference order matrix into student x faculty -> rank
+    
+    Args:
+        preference_order: int16 matrix (student x rank -> faculty index, -1 if unranked)
+    
+    Returns:
+        np.ndarray: int16 matrix of the rank each student gave each faculty, 0 if unranked
+    """
+    n_students, n_faculties = preference_order.shape
+    # Unranked slots (-1) are written to a spare last column and dropped
+    rank_of = np.zeros((n_students, n_faculties + 1), dtype=np.int16)
+    target = np.where(preference_order >= 0, preference_order, n_faculties)
+    ranks = np.broadcast_to(np.arange(1, n_faculties + 1, dtype=np.int16), preference_order.shape)
+    np.put_along_axis(rank_of, target, ranks, axis=1)
+    return np.ascontiguousarray(rank_of[:, :n_faculties])
+
+
+def min_cost_allocation_kernel(preference_order: np.ndarray, capacities: np.ndarray,
+                               top_k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rank-weighted min-cost assignment with per-faculty capacities
+    
+    Minimises the sum of allocated preference ranks by successive shortest
+    augmenting paths, processing students in row (CGPA) order. Paths are
+    searched on the faculty graph: an edge f -> g moves the student in f
+    whose rank changes least by moving to g, so each search costs O(F^2)
+    instead of touching every student. Shortest distances to a faculty with
+    a free seat are only recomputed when a faculty fills up or students are
+    moved, so most students are placed in O(F).
+    
+    Args:
+        preference_order: int16 matrix (student x rank -> faculty index, -1 if unranked)
+        capacities: Seats per faculty
+        top_k: Sparse mode, only keep each student's top_k ranked faculties as
+            edges. By default every faculty is an edge and unranked ones cost
+            n_faculties + 1.
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Allocated faculty index (int32, -1 if no
+        seat could be reached) and preference rank (int16, 0 if unranked)
+    """
+    n_students, n_faculties = preference_order.shape
+    capacities = np.asarray(capacities, dtype=np.int32)
+    
+    # rank_of[s, f]: rank student s gave faculty f (0 if unranked), turned into
+    # an edge cost by table lookup; inf marks a missing edge in sparse mode
+    rank_of = _rank_matrix(preference_order)
+    cost_table = np.arange(n_faculties + 1, dtype=np.float32)
+    if top_k is not None and top_k < n_faculties:
+        cost_table[0] = np.inf
+        cost_table[top_k + 1:] = np.inf
+    else:
+        cost_table[0] = n_faculties + 1
+    
+    allocated = np.full(n_students, -1, dtype=np.int32)
+    load = np.zeros(n_faculties, dtype=np.int32)
+    members: List[List[int]] = [[] for _ in range(n_faculties)]
+    
+    # transfer[f, g]: cheapest cost change of moving one student of f to g
+    transfer = np.full((n_faculties, n_faculties), np.inf, dtype=np.float32)
+    transfer_student = np.full((n_faculties, n_faculties), -1, dtype=np.int64)
+    
+    # distance[f]: cheapest chain of moves from f to a faculty with a free seat
+    distance = np.where(capacities > 0, 0, np.inf).astype(np.float32)
+    next_hop = np.full(n_faculties, -1, dtype=np.int64)
+    
+    def refresh_transfer(faculty_idx: int) -> None:
+        transfer[faculty_idx] = np.inf
+        transfer_student[faculty_idx] = -1
+        if not members[faculty_idx]:
+            return
+        students = np.asarray(members[faculty_idx])
+        delta = cost_table[rank_of[students]]
+        delta -= delta[:, faculty_idx][:, None]
+        best = delta.argmin(axis=0)
+        transfer[faculty_idx] = delta[best, np.arange(n_faculties)]
+        transfer_student[faculty_idx] = students[best]
+        transfer[faculty_idx, faculty_idx] = np.inf
+    
+    def add_member(faculty_idx: int, student_idx: int) -> None:
+        # Joining can only make moves out of the faculty cheaper
+        members[faculty_idx].append(student_idx)
+        allocated[student_idx] = faculty_idx
+        delta = cost_table[rank_of[student_idx]]
+        delta -= delta[faculty_idx]
+        delta[faculty_idx] = np.inf
+        cheaper = delta < transfer[faculty_idx]
+        transfer[faculty_idx, cheaper] = delta[cheaper]
+        transfer_student[faculty_idx, cheaper] = student_idx
+    
+    def remove_member(faculty_idx: int, student_idx: int) -> None:
+        members[faculty_idx].remove(student_idx)
+        if (transfer_student[faculty_idx] == student_idx).any():
+            refresh_transfer(faculty_idx)
+    
+    def refresh_distance() -> None:
+        # Bellman-Ford; the current assignment is min-cost so there are no negative cycles
+        distance[:] = np.where(load < capacities, 0, np.inf)
+        next_hop[:] = -1
+        for _ in range(n_faculties):
+            candidates = transfer + distance[None, :]
+            hop = candidates.argmin(axis=1)
+            via = candidates[np.arange(n_faculties), hop]
+            improved = via < distance
+            if not improved.any():
+                break
+            distance[improved] = via[improved]
+            next_hop[improved] = hop[improved]
+    
+    for idx in range(n_students):
+        total = cost_table[rank_of[idx]] + distance
+        first = int(total.argmin())
+        if not np.isfinite(total[first]):
+            continue
+        
+        path = [first]
+        while load[path[-1]] >= capacities[path[-1]]:
+            path.append(int(next_hop[path[-1]]))
+        
+        # Look up every move before applying any of them
+        moves = [(source, target, int(transfer_student[source, target]))
+                 for source, target in zip(path, path[1:])]
+        for source, target, moved in moves:
+            remove_member(source, moved)
+            add_member(target, moved)
+        
+        add_member(first, idx)
+        load[path[-1]] += 1
+        
+        if len(path) > 1 or load[path[-1]] >= capacities[path[-1]]:
+            refresh_distance()
+    
+    preference_rank = np.where(allocated >= 0, rank_of[np.arange(n_students), allocated], 0).astype(np.int16)
+    
+    return allocated, preference_rank
+
+
+@register_strategy('min_cost')
+def min_cost_strategy(cohort: PreparedCohort, top_k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Optimal preference satisfaction: minimise the total allocated rank under
+    the faculty capacities. Students left without a reachable seat in sparse
+    (top_k) mode get the least loaded faculty with a free seat.
+    """
+    capacities = cohort.capacities()
+    allocated, preference_rank = min_cost_allocation_kernel(cohort.preference_order, capacities, top_k)
+    
+    load = np.bincount(allocated[allocated >= 0], minlength=cohort.n_faculties).astype(np.int32)
+    _assign_fallback(allocated, load, capacities)
+    
+    return allocated, preference_rank
+
+
+def deferred_acceptance_kernel(preference_order: np.ndarray, capacities: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Student-proposing deferred acceptance (Gale-Shapley)
+    
+    Faculties rank students by row order, i.e. by CGPA as sorted by
+    sort_students_by_cgpa. Free students sit on an array stack and propose
+    down their preference order; each faculty keeps its held students in a
+    heap keyed on priority, so a proposal costs O(log capacity) and the whole
+    run is O(total proposals). The result is stable: no student prefers a
+    faculty that has a free seat or holds a lower-CGPA student.
+    
+    Args:
+        preference_order: int16 matrix (student x rank -> faculty index, -1 if unranked)
+        capacities: Seats per faculty
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Allocated faculty index (int32, -1 if the
+        student's ranked faculties all rejected them) and preference rank (int16)
+    """
+    n_students, n_faculties = preference_order.shape
+    capacities = np.asarray(capacities, dtype=np.int32).tolist()
+    
+    allocated = np.full(n_students, -1, dtype=np.int32)
+    preference_rank = np.zeros(n_students, dtype=np.int16)
+    next_position = np.zeros(n_students, dtype=np.int32)
+    
+    # Held students per faculty as a max-heap on row index (lowest priority on top)
+    held: List[List[int]] = [[] for _ in range(n_faculties)]
+    
+    # Stack of free students, highest priority popped first
+    free_students = list(range(n_students - 1, -1, -1))
+    
+    while free_students:
+        idx = free_students.pop()
+        position = int(next_position[idx])
+        
+        while position < n_faculties:
+            faculty_idx = int(preference_order[idx, position])
+            position += 1
+            if faculty_idx < 0 or not capacities[faculty_idx]:
+                continue
+            
+            heap = held[faculty_idx]
+            if len(heap) < capacities[faculty_idx]:
+                heapq.heappush(heap, -idx)
+            elif -heap[0] > idx:
+                rejected = -heapq.heapreplace(heap, -idx)
+                allocated[rejected] = -1
+                preference_rank[rejected] = 0
+                free_students.append(rejected)
+            else:
+                continue
+            
+            allocated[idx] = faculty_idx
+            preference_rank[idx] = position
+            break
+        
+        next_position[idx] = position
+    
+    return allocated, preference_rank
+
+
+def find_blocking_pairs(preference_order: np.ndarray, capacities: np.ndarray,
+                        allocated: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    List (student, faculty) pairs that block an allocation under CGPA priorities
+    
+    A pair blocks if the student ranked the faculty above their allocation
+    (or is not allocated to a ranked faculty) and the faculty either has a
+    free seat or holds a student with lower priority (a later row).
+    
+    Args:
+        preference_order: int16 matrix (student x rank -> faculty index, -1 if unranked)
+        capacities: Seats per faculty
+        allocated: Faculty index per student, -1 if unallocated
+    
+    Returns:
+        List[Tuple[int, int]]: Blocking (student row, faculty index) pairs
+    """
+    n_students, n_faculties = preference_order.shape
+    rank_of = _rank_matrix(preference_order)
+    
+    seated = allocated >= 0
+    held_rank = np.zeros(n_students, dtype=np.int64)
+    held_rank[seated] = rank_of[np.flatnonzero(seated), allocated[seated]]
+    held_rank[held_rank == 0] = n_faculties + 1
+    
+    load = np.bincount(allocated[seated], minlength=n_faculties)
+    worst = np.full(n_faculties, -1, dtype=np.int64)
+    np.maximum.at(worst, allocated[seated], np.flatnonzero(seated))
+    has_seat = load < np.asarray(capacities)
+    
+    prefers = (rank_of > 0) & (rank_of < held_rank[:, None])
+    admits = has_seat[None, :] | (worst[None, :] > np.arange(n_students)[:, None])
+    students, faculties = np.nonzero(prefers & admits)
+    
+    return list(zip(students.tolist(), faculties.tolist()))
+
+
+@register_strategy('deferred_acceptance')
+def deferred_acceptance_strategy(cohort: PreparedCohort, capacities: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stable matching with faculties ranking students by CGPA. Students
+    rejected by every ranked faculty get the least loaded faculty with a free
+    seat.
+    """
+    if capacities is None:
+        capacities = cohort.capacities()
+    capacities = np.asarray(capacities, dtype=np.int32)
+    
+    allocated, preference_rank = deferred_acceptance_kernel(cohort.preference_order, capacities)
+    
+    load = np.bincount(allocated[allocated >= 0], minlength=cohort.n_faculties).astype(np.int32)
+    _assign_fallback(allocated, load, capacities)
+    
+    return allocated, preference_rank
+
+
+def enforce_minimum_capacities(preference_order: np.ndarray, allocated: np.ndarray, preference_rank: np.ndarray,
+                               min_capacity: np.ndarray) -> int:
+    """
+    Move students into faculties that are below their minimum seats
+    
+    Short faculties are topped up in column order. Each move takes, from a
+    faculty above its own minimum, the student who ranked the short faculty
+    best (lowest CGPA on ties).
+    
+    Args:
+        preference_order: int16 matrix (student x rank -> faculty index, -1 if unranked)
+        allocated: Faculty index per student, updated in place
+        preference_rank: Preference rank per student, updated in place
+        min_capacity: Minimum seats per faculty
+    
+    Returns:
+        int: Number of seats still short after all possible moves
+    """
+    n_faculties = preference_order.shape[1]
+    rank_of = _rank_matrix(preference_order)
+    load = np.bincount(allocated, minlength=n_faculties)
+    
+    for faculty_idx in np.flatnonzero(load < min_capacity):
+        # Unranked counts as worse than any rank
+        move_cost = np.where(rank_of[:, faculty_idx] > 0, rank_of[:, faculty_idx], n_faculties + 1)
+        
+        while load[faculty_idx] < min_capacity[faculty_idx]:
+            donors = np.flatnonzero((load[allocated] > min_capacity[allocated]) & (allocated != faculty_idx))
+            if not donors.size:
+                break
+            
+            costs = move_cost[donors]
+            moved = donors[costs == costs.min()][-1]
+            
+            load[allocated[moved]] -= 1
+            load[faculty_idx] += 1
+            allocated[moved] = faculty_idx
+            preference_rank[moved] = rank_of[moved, faculty_idx]
+    
+    return int(np.maximum(min_capacity - load, 0).sum())
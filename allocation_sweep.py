@@ -0,0 +1,202 @@
+"""
+BTP/MTP Allocation Scenario Sweep
+Runs many allocation scenarios over one preprocessed cohort in parallel
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Union
+import numpy as np
+import pandas as pd
+from allocation_engine import AllocationEngine
+from allocation_io import REQUIRED_COLUMNS, open_rank_matrix, write_rank_matrix
+from allocation_strategies import PreparedCohort, get_strategy, shuffle_within_groups, tie_groups
+
+logger = logging.getLogger(__name__)
+
+# Cohort shared by every scenario a worker process runs, set by _init_worker
+_worker_cohort = None
+
+
+def _init_worker(students: pd.DataFrame, faculties: List[str], preference_order_path: str) -> None:
+    """
+    Attach a worker to the shared cohort
+    
+    The preference order matrix is memory-mapped read-only, so all workers
+    share one copy through the OS page cache; only the small identity frame
+    is pickled to each process.
+    """
+    global _worker_cohort
+    _worker_cohort = PreparedCohort(students, faculties, open_rank_matrix(preference_order_path))
+
+
+def summary_row(summary: Dict, n_faculties: int) -> Dict:
+    """
+    Flatten get_allocation_summary output into one comparison table row
+    
+    Args:
+        summary: Allocation summary
+        n_faculties: Number of faculties, so idle faculties count as load 0
+    
+    Returns:
+        Dict: Scalar metrics
+    """
+    satisfaction = summary['preference_satisfaction']
+    ranked = summary['total_students'] - satisfaction['fallback']
+    rank_total = sum(rank * count for rank, count in summary['rank_distribution'].items())
+    loads = list(summary['faculty_distribution'].values())
+    loads += [0] * (n_faculties - len(loads))
+    
+    return {
+        'total_students': summary['total_students'],
+        'pref_1': satisfaction['pref_1'],
+        'pref_2': satisfaction['pref_2'],
+        'pref_3': satisfaction['pref_3'],
+        'other': satisfaction['other'],
+        'fallback': satisfaction['fallback'],
+        'mean_rank': rank_total / ranked if ranked else float('nan'),
+        'max_load': max(loads, default=0),
+        'min_load': min(loads, default=0)
+    }
+
+
+def tie_broken_cohort(prepared: PreparedCohort, seed: int) -> PreparedCohort:
+    """
+    Reorder a cohort by one seeded random tie-break between equal CGPAs
+    
+    Students only move inside their equal-CGPA group, the same shuffle
+    AllocationEngine.simulate_tie_breaks draws.
+    
+    Args:
+        prepared: Cohort in allocation order
+        seed: Random seed
+    
+    Returns:
+        PreparedCohort: Reordered cohort (new arrays, the input is unchanged)
+    """
+    groups = tie_groups(prepared.students['CGPA'].to_numpy(dtype=np.float64, na_value=np.nan))
+    order = shuffle_within_groups(groups, 1, np.random.default_rng(seed))[0]
+    return PreparedCohort(prepared.students.iloc[order].reset_index(drop=True), prepared.faculties,
+                          prepared.preference_order[order])
+
+
+def _run_scenario(scenario: Dict) -> Dict:
+    """Allocate one scenario on the worker's shared cohort and summarise it"""
+    engine = AllocationEngine(scenario['strategy'], scenario.get('options'))
+    cohort = _worker_cohort
+    if scenario.get('tie_break_seed') is not None:
+        cohort = tie_broken_cohort(cohort, scenario['tie_break_seed'])
+    engine.use_prepared(cohort)
+    if scenario.get('capacities') is not None and not engine.load_capacities(scenario['capacities']):
+        raise ValueError(f"Could not load capacities for scenario '{scenario['name']}'")
+    
+    start = time.perf_counter()
+    engine.allocate_students()
+    elapsed = time.perf_counter() - start
+    
+    row = {'scenario': scenario['name'], 'strategy': scenario['strategy']}
+    row.update(summary_row(engine.get_allocation_summary(), len(engine.faculties)))
+    row['seconds'] = elapsed
+    return row
+
+
+def normalize_scenarios(scenarios: List[Union[str, Dict]]) -> List[Dict]:
+    """
+    Fill in defaults for scenario specs
+    
+    A scenario is a strategy name or a dict with 'strategy' and optionally
+    'name', 'options' (strategy options), 'capacities' (anything
+    AllocationEngine.load_capacities accepts) and 'tie_break_seed' (seed of
+    a random order between equal-CGPA students; None keeps the input order).
+    
+    Args:
+        scenarios: Scenario specs
+    
+    Returns:
+        List[Dict]: Scenarios with name, strategy, options, capacities and
+        tie_break_seed set
+    """
+    normalized = []
+    for scenario in scenarios:
+        if isinstance(scenario, str):
+            scenario = {'strategy': scenario}
+        scenario = {'options': None, 'capacities': None, 'tie_break_seed': None, **scenario}
+        get_strategy(scenario['strategy'])
+        if 'name' not in scenario:
+            label = scenario['capacities'] if isinstance(scenario['capacities'], str) else None
+            scenario['name'] = scenario['strategy'] if label is None else f"{scenario['strategy']}@{os.path.basename(label)}"
+            if scenario['tie_break_seed'] is not None:
+                scenario['name'] += f"#seed{scenario['tie_break_seed']}"
+        normalized.append(scenario)
+    
+    names = [scenario['name'] for scenario in normalized]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Scenario names must be unique, got {names}")
+    
+    return normalized
+
+
+def run_sweep(source: Union[str, AllocationEngine], scenarios: List[Union[str, Dict]],
+              max_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Run allocation scenarios over one cohort and compare their outcomes
+    
+    The input is loaded, sorted and turned into a preference order matrix
+    once; scenarios then fan out over a process pool that shares the matrix
+    read-only.
+    
+    Args:
+        source: Input CSV path, or an engine with data already loaded
+        scenarios: Scenario specs, see normalize_scenarios
+        max_workers: Worker processes, defaults to the CPU count; 1 runs in-process
+    
+    Returns:
+        pd.DataFrame: One row per scenario (indexed by name) with the
+        summary metrics and allocation time
+    """
+    global _worker_cohort
+    scenarios = normalize_scenarios(scenarios)
+    
+    if isinstance(source, AllocationEngine):
+        engine = source
+    else:
+        engine = AllocationEngine()
+        if not engine.load_data(source):
+            raise ValueError(f"Could not load {source}")
+    
+    prepared = engine.prepare()
+    students = prepared.students[REQUIRED_COLUMNS]
+    workers = min(max_workers or os.cpu_count() or 1, len(scenarios))
+    logger.info("Running %s scenarios on %s students with %s workers", len(scenarios), prepared.n_students, workers)
+    
+    with tempfile.TemporaryDirectory(prefix='allocation-sweep-') as shared_dir:
+        # Same int16 .npy layout as the rank matrix, so workers can map it
+        preference_order_path = os.path.join(shared_dir, 'preference_order.npy')
+        write_rank_matrix(preference_order_path, prepared.preference_order)
+        
+        if workers <= 1:
+            _init_worker(students, prepared.faculties, preference_order_path)
+            try:
+                rows = [_run_scenario(scenario) for scenario in scenarios]
+            finally:
+                _worker_cohort = None
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(students, prepared.faculties, preference_order_path)) as pool:
+                rows = list(pool.map(_run_scenario, scenarios))
+    
+    return pd.DataFrame(rows).set_index('scenario')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point, same as btp-allocate sweep"""
+    from allocation_cli import main as cli_main
+    return cli_main(['sweep'] + (sys.argv[1:] if argv is None else argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
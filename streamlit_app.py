@@ -8,20 +8,23 @@ import pandas as pd
 import io
 import logging
 from allocation_engine import AllocationEngine
+from allocation_io import content_digest
+from allocation_logging import configure_logging
+from allocation_metrics import REGISTRY, record_error, start_http_server, track_run
 import os
 from datetime import datetime
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('streamlit_app.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# Optional Prometheus exporter: a /metrics endpoint on this port and/or a
+# textfile rewritten after every run (for the node_exporter textfile collector)
+METRICS_PORT = os.environ.get('BTP_METRICS_PORT')
+METRICS_TEXTFILE = os.environ.get('BTP_METRICS_TEXTFILE')
+
+# Parsed uploads and allocation results are cached per upload content hash,
+# keeping at most this many files (least recently used entries are evicted)
+CACHE_ENTRIES = int(os.environ.get('BTP_CACHE_ENTRIES', '8'))
+
 # Page configuration
 st.set_page_config(
     page_title="BTP/MTP Allocation System",
@@ -33,6 +36,10 @@ st.set_page_config(
 def main():
     """Main Streamlit application"""
     
+    # Streamlit reruns this script on every interaction; the server starts once per process
+    if METRICS_PORT:
+        start_http_server(int(METRICS_PORT))
+    
     # Header
     st.title("🎓 BTP/MTP Allocation System")
     st.markdown("---")
@@ -60,8 +67,10 @@ def upload_and_process_page():
     
     if uploaded_file is not None:
         try:
-            # Read the uploaded file
-            df = pd.read_csv(uploaded_file)
+            # Read the uploaded file (reruns and re-uploads of the same content hit the cache)
+            data = uploaded_file.getvalue()
+            digest = content_digest(data)
+            df = parse_upload(digest, data)
             
             # Display file info
             st.success(f"✅ File uploaded successfully!")
@@ -79,12 +88,17 @@ def upload_and_process_page():
                 st.error(f"❌ Missing required columns: {missing_columns}")
                 return
             
-            # Process button
+            # Process button; results stay on screen across reruns (e.g. download clicks)
+            processed = st.session_state.setdefault('processed_digests', set())
             if st.button("🚀 Process Allocation", type="primary"):
-                process_allocation(df, uploaded_file.name)
+                processed.add(digest)
+            if digest in processed:
+                process_allocation(df, digest, len(data))
                 
         except Exception as e:
-            logger.error(f"Error processing uploaded file: {str(e)}")
+            record_error('upload', e)
+            export_metrics()
+            logger.error("Error processing uploaded file: %s", e)
             st.error(f"❌ Error reading file: {str(e)}")
     
     else:
@@ -102,7 +116,51 @@ def upload_and_process_page():
         }
         st.dataframe(pd.DataFrame(sample_data))
 
-def process_allocation(df, filename):
+def export_metrics():
+    """Rewrite the metrics textfile, if one is configured"""
+    if METRICS_TEXTFILE:
+        REGISTRY.write_textfile(METRICS_TEXTFILE)
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def parse_upload(digest, _data):
+    """
+    Parse an uploaded CSV
+    
+    Cached by digest only; the leading underscore stops Streamlit from
+    hashing the raw bytes again on every rerun.
+    """
+    return pd.read_csv(io.BytesIO(_data))
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def run_allocation(digest, _df, _upload_bytes=None):
+    """
+    Allocate, generate statistics and summarise one upload
+    
+    Cached by digest, so only real runs reach the metrics registry.
+    
+    Returns:
+        tuple: Allocation results, preference statistics, summary and the
+        two download CSVs
+    """
+    # Latency, throughput, upload size, peak memory and errors go to the metrics registry
+    with track_run(len(_df), _upload_bytes):
+        engine = AllocationEngine()
+        engine.students_data = _df
+        
+        # Extract faculty names
+        cgpa_col_index = _df.columns.get_loc('CGPA')
+        engine.faculties = list(_df.columns[cgpa_col_index + 1:])
+        
+        allocation_results = engine.allocate_students()
+        preference_stats = engine.generate_preference_stats()
+        summary = engine.get_allocation_summary()
+        
+        allocation_csv = allocation_results[['Roll', 'Name', 'Email', 'CGPA', 'Allocated']].to_csv(index=False)
+        preference_csv = preference_stats.to_csv(index=False)
+    
+    return allocation_results, preference_stats, summary, allocation_csv, preference_csv
+
+def process_allocation(df, digest, upload_bytes=None):
     """Process the allocation and show results"""
     
     try:
@@ -110,35 +168,12 @@ def process_allocation(df, filename):
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        # Step 1: Initialize engine
-        status_text.text("🔄 Initializing allocation engine...")
-        progress_bar.progress(10)
-        
-        engine = AllocationEngine()
-        engine.students_data = df
-        
-        # Extract faculty names
-        cgpa_col_index = df.columns.get_loc('CGPA')
-        engine.faculties = list(df.columns[cgpa_col_index + 1:])
-        
-        # Step 2: Perform allocation
         status_text.text("🔄 Allocating students to faculties...")
-        progress_bar.progress(30)
-        
-        allocation_results = engine.allocate_students()
-        
-        # Step 3: Generate preference statistics
-        status_text.text("🔄 Generating preference statistics...")
-        progress_bar.progress(60)
-        
-        preference_stats = engine.generate_preference_stats()
-        
-        # Step 4: Prepare results
-        status_text.text("🔄 Preparing results...")
-        progress_bar.progress(80)
+        progress_bar.progress(10)
         
-        # Get summary
-        summary = engine.get_allocation_summary()
+        allocation_results, preference_stats, summary, allocation_csv, preference_csv = run_allocation(
+            digest, df, upload_bytes)
+        export_metrics()
         
         # Complete
         progress_bar.progress(100)
@@ -148,10 +183,11 @@ def process_allocation(df, filename):
         display_results(allocation_results, preference_stats, summary)
         
         # Download buttons
-        download_section(allocation_results, preference_stats, filename)
+        download_section(allocation_csv, preference_csv)
         
     except Exception as e:
-        logger.error(f"Error in allocation process: {str(e)}")
+        export_metrics()
+        logger.error("Error in allocation process: %s", e)
         st.error(f"❌ Error during processing: {str(e)}")
         st.exception(e)
 
@@ -194,7 +230,7 @@ def display_results(allocation_results, preference_stats, summary):
     st.subheader("📈 Faculty Preference Statistics")
     st.dataframe(preference_stats)
 
-def download_section(allocation_results, preference_stats, original_filename):
+def download_section(allocation_csv, preference_csv):
     """Create download buttons for results"""
     
     st.header("💾 Download Results")
@@ -202,13 +238,6 @@ def download_section(allocation_results, preference_stats, original_filename):
     # Prepare files for download
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
-    # Allocation results
-    allocation_output = allocation_results[['Roll', 'Name', 'Email', 'CGPA', 'Allocated']].copy()
-    allocation_csv = allocation_output.to_csv(index=False)
-    
-    # Preference statistics
-    preference_csv = preference_stats.to_csv(index=False)
-    
     col1, col2 = st.columns(2)
     
     with col1:
@@ -279,8 +308,10 @@ def about_page():
     st.markdown("**Developed for Algorithm Course Assignment 2**")
 
 if __name__ == "__main__":
+    # Streamlit runs this script as __main__ on every interaction; only the first run installs handlers
+    configure_logging('streamlit_app.log')
     try:
         main()
     except Exception as e:
-        logger.error(f"Error in Streamlit app: {str(e)}")
+        logger.error("Error in Streamlit app: %s", e)
         st.error("❌ An error occurred. Please check the logs for details.")
@@ -4,8 +4,25 @@ Test script for the BTP/MTP Allocation Engine
 
 import pandas as pd
 import logging
+import numpy as np
+import pytest
 from allocation_engine import AllocationEngine
+from allocation_io import (cache_path_for, content_digest, file_digest, load_students_cache, read_snapshot,
+                           write_snapshot)
+from allocation_strategies import (CycleAllocator, cycle_batch_kernel, find_blocking_pairs,
+                                   preference_order_from_ranks, shuffle_within_groups, tie_groups)
+from allocation_sweep import run_sweep, summary_row, tie_broken_cohort
+from allocation_batch import allocate_cohorts, save_cohort_results, split_cohorts
+from allocation_cli import EXIT_FAILURE, EXIT_NO_INPUT, EXIT_OK, EXIT_USAGE, main as cli_main
+from allocation_benchmark import PHASES, find_regressions, generate_cohort, run_benchmarks
+from allocation_metrics import REGISTRY, MetricsRegistry, start_http_server, track_run
+from allocation_logging import start_queue_logging, stop_queue_logging
+import json
 import os
+import shutil
+import subprocess
+import sys
+import urllib.request
 
 # Configure logging for testing
 logging.basicConfig(level=logging.INFO)
@@ -54,6 +71,526 @@ def test_allocation_engine():
         logger.error(f"❌ Test failed: {str(e)}")
         return False
 
+def test_preference_order_matches_rank_scan():
+    """The preference order matrix agrees with a per-rank scan of the faculty columns"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    
+    students = engine.sort_students_by_cgpa()
+    preference_order = engine.build_preference_order(students)
+    
+    for idx, student in students.iterrows():
+        for preference_rank in range(1, len(engine.faculties) + 1):
+            expected = next((i for i, faculty in enumerate(engine.faculties)
+                             if student[faculty] == preference_rank), -1)
+            assert preference_order[idx, preference_rank - 1] == expected
+    
+    # Small row blocks gathered through positions give the same matrix
+    blocked = preference_order_from_ranks(engine.rank_block(), len(engine.faculties), engine.cgpa_order(), block_rows=7)
+    assert np.array_equal(blocked, preference_order)
+
+def test_strategies_share_prepared_cohort():
+    """Every registered strategy allocates everyone from one prepared cohort"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    
+    prepared = engine.prepare()
+    capacity = prepared.default_capacities()
+    
+    for strategy in ['cycle', 'serial_dictatorship', 'capacity_greedy']:
+        results = engine.allocate_students(strategy, reuse_prepared=True)
+        assert engine.prepare(reuse=True) is prepared
+        assert len(results) == len(engine.students_data)
+        assert results['Allocated'].value_counts().max() <= capacity.max()
+
+def test_in_place_edits_are_allocated():
+    """Editing students_data in place is seen by the next allocation unless reuse is requested"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    first = engine.allocate_students()
+    last_roll = first['Roll'].iloc[-1]
+    
+    engine.students_data.loc[engine.students_data['Roll'] == last_roll, 'CGPA'] = 10.0
+    assert engine.allocate_students(reuse_prepared=True)['Roll'].iloc[-1] == last_roll
+    assert engine.allocate_students()['Roll'].iloc[0] == last_roll
+
+def test_min_cost_never_worse_than_greedy():
+    """The min-cost strategy gives the lowest total preference rank"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    
+    total_rank = {}
+    for strategy in ['cycle', 'serial_dictatorship', 'capacity_greedy', 'min_cost']:
+        results = engine.allocate_students(strategy)
+        total_rank[strategy] = results['Preference_Rank'].astype(int).sum()
+    
+    assert total_rank['min_cost'] == min(total_rank.values())
+    
+    sparse = engine.allocate_students('min_cost', top_k=3)
+    assert sparse['Preference_Rank'].astype(int).sum() == total_rank['min_cost']
+
+def test_deferred_acceptance_is_stable():
+    """Deferred acceptance leaves no blocking pairs under CGPA priorities"""
+    
+    engine = AllocationEngine(strategy='deferred_acceptance')
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    
+    results = engine.allocate_students()
+    assert list(results.columns) == ['Roll', 'Name', 'Email', 'CGPA', 'Allocated', 'Preference_Rank', 'is_fallback']
+    
+    prepared = engine.prepare()
+    allocated = np.array([engine.faculties.index(faculty) for faculty in results['Allocated']])
+    assert find_blocking_pairs(prepared.preference_order, prepared.default_capacities(), allocated) == []
+
+def test_explicit_capacities_respected_by_every_strategy():
+    """Explicit min/max seats hold for every strategy"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    assert engine.load_capacities({'ABM': (7, 8), 'AE': 2, 'AM': {'min': 6, 'max': 9}})
+    
+    for strategy in ['cycle', 'serial_dictatorship', 'capacity_greedy', 'min_cost', 'deferred_acceptance']:
+        counts = engine.allocate_students(strategy)['Allocated'].value_counts()
+        assert 7 <= counts['ABM'] <= 8
+        assert counts['AE'] <= 2
+        assert 6 <= counts['AM'] <= 9
+        assert counts.sum() == len(engine.students_data)
+
+def test_capacities_with_blank_preferences():
+    """Blank preferences never match a seat under explicit capacities"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    ranks = engine.students_data[engine.faculties]
+    engine.students_data[engine.faculties] = ranks.mask(np.random.default_rng(5).random(ranks.shape) < 0.4)
+    limits = {faculty: 5 + i % 3 for i, faculty in enumerate(engine.faculties)}
+    assert engine.load_capacities(limits)
+    results = engine.allocate_students('cycle')
+    
+    loads = results['Allocated'].value_counts()
+    assert all(loads[faculty] <= limits[faculty] for faculty in loads.index)
+    ranked = results[~results['is_fallback']].merge(engine.students_data, on='Roll', suffixes=('', '_input'))
+    assert all(row[row['Allocated']] == row['Preference_Rank'] for _, row in ranked.iterrows())
+
+def test_update_students_matches_full_rerun():
+    """Incremental re-allocation after edits matches allocating the edited data from scratch"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    assert engine.load_capacities({'ABM': 3, 'AE': 2})
+    rolls = engine.allocate_students()['Roll']
+    
+    # One student moves up the CGPA order, another leaves a preference blank
+    edits = pd.DataFrame({'Roll': [rolls.iat[40], rolls.iat[70]], 'CGPA': [9.99, 5.0],
+                          'RM': [1, None], 'ABM': [2, 1]})
+    updated = engine.update_students(edits)
+    
+    fresh = AllocationEngine()
+    fresh.students_data, fresh.faculties = engine.students_data, engine.faculties
+    assert fresh.load_capacities({'ABM': 3, 'AE': 2})
+    assert updated.equals(fresh.allocate_students())
+    
+    # Every ranked assignment is to the faculty the student gave that rank
+    ranked = updated[~updated['is_fallback']].merge(engine.students_data, on='Roll')
+    given = [row[faculty] for faculty, (_, row) in zip(ranked['Allocated'], ranked.iterrows())]
+    assert list(ranked['Preference_Rank']) == given
+
+def test_snapshot_resume_and_replay(tmp_path):
+    """A run resumed from a partial snapshot, and a replay of any cycle, match the uninterrupted run"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    full = engine.allocate_students()
+    
+    # Simulate a run that stopped after three cycles
+    snapshot_file = str(tmp_path / 'run.npz')
+    prepared = engine.prepare()
+    partial = CycleAllocator(prepared.preference_order, prepared.n_faculties)
+    partial.run(stop=3 * prepared.n_faculties)
+    write_snapshot(snapshot_file, partial.snapshot())
+    assert len(read_snapshot(snapshot_file)['checkpoints']) == 4
+    
+    # Replaying from the boundary the partial run stopped on starts from its counters
+    n_faculties = len(engine.faculties)
+    replayed = engine.replay_from_snapshot(snapshot_file, 3, 5)
+    assert replayed.equals(full.iloc[3 * n_faculties:5 * n_faculties].reset_index(drop=True))
+    
+    resumed = engine.allocate_students('cycle', snapshot_path=snapshot_file, snapshot_every=1, resume=True)
+    assert resumed.equals(full)
+    assert int(read_snapshot(snapshot_file)['position']) == len(full)
+    
+    replayed = engine.replay_from_snapshot(snapshot_file, 2, 4)
+    assert replayed.equals(full.iloc[2 * n_faculties:4 * n_faculties].reset_index(drop=True))
+
+def test_sweep_matches_direct_runs():
+    """Parallel and in-process sweeps give the same table as running each scenario directly"""
+    
+    scenarios = ['cycle', {'name': 'capped', 'strategy': 'min_cost', 'capacities': {'ABM': 2, 'AE': 3}}]
+    parallel = run_sweep('input_btp_mtp_allocation.csv', scenarios, max_workers=2)
+    serial = run_sweep('input_btp_mtp_allocation.csv', scenarios, max_workers=1)
+    assert list(parallel.index) == ['cycle', 'capped']
+    assert parallel.drop(columns='seconds').equals(serial.drop(columns='seconds'))
+    
+    engine = AllocationEngine('min_cost')
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    assert engine.load_capacities({'ABM': 2, 'AE': 3})
+    engine.allocate_students()
+    expected = summary_row(engine.get_allocation_summary(), len(engine.faculties))
+    assert parallel.loc['capped', list(expected)].to_dict() == expected
+    
+    # A tie-break seed reorders equal-CGPA students the same way in every worker
+    seeded = run_sweep('input_btp_mtp_allocation.csv', [{'strategy': 'cycle', 'tie_break_seed': 7}], max_workers=1)
+    assert list(seeded.index) == ['cycle#seed7']
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    engine.use_prepared(tie_broken_cohort(engine.prepare(), 7))
+    engine.allocate_students()
+    expected = summary_row(engine.get_allocation_summary(), len(engine.faculties))
+    assert seeded.loc['cycle#seed7', list(expected)].to_dict() == expected
+
+def test_tie_break_simulation():
+    """Batched tie-break runs match single runs, and untied students always get the same faculty"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    prepared = engine.prepare()
+    groups = tie_groups(prepared.students['CGPA'].to_numpy())
+    orders = shuffle_within_groups(groups, 5, np.random.default_rng(0))
+    
+    for capacities in [None, np.full(prepared.n_faculties, 6, dtype=np.int32)]:
+        allocated, preference_rank = cycle_batch_kernel(prepared.preference_order, prepared.n_faculties,
+                                                        orders, capacities)
+        for run, order in enumerate(orders):
+            single = CycleAllocator(prepared.preference_order[order], prepared.n_faculties, capacities)
+            single.run()
+            assert np.array_equal(allocated[run], single.allocated)
+            assert np.array_equal(preference_rank[run], single.preference_rank)
+    
+    probabilities, frequencies = engine.simulate_tie_breaks(200, seed=1)
+    assert np.allclose(probabilities[engine.faculties].sum(axis=1), 1)
+    assert (frequencies.drop(columns=['Roll', 'Name', 'CGPA']).sum(axis=1) == 200).all()
+    
+    # Before the first tie nothing can change
+    results = engine.allocate_students()
+    first_tie = int(np.flatnonzero(np.bincount(groups) > 1)[0])
+    untied = int(np.flatnonzero(groups == first_tie)[0])
+    for idx in range(untied):
+        assert probabilities.loc[idx, results['Allocated'].iat[idx]] == 1
+
+def test_batch_cohorts_match_single_engines(tmp_path):
+    """Cohorts from one keyed file or separate files allocate as they would on their own"""
+    
+    students = pd.read_csv('input_btp_mtp_allocation.csv')
+    students.insert(0, 'Dept', ['CB'] * 45 + ['ME'] * 45)
+    # ME students never rank the last faculty, so that column is dropped for ME
+    students.loc[45:, 'ST'] = None
+    keyed_file = tmp_path / 'cohorts.csv'
+    students.to_csv(keyed_file, index=False)
+    
+    cohorts = split_cohorts(str(keyed_file), 'Dept')
+    assert list(cohorts) == ['CB', 'ME']
+    assert 'ST' not in cohorts['ME'][1]
+    
+    paths = []
+    for name, group in students.groupby('Dept'):
+        path = tmp_path / f'{name}.csv'
+        group.drop(columns='Dept').dropna(axis=1, how='all').to_csv(path, index=False)
+        paths.append(str(path))
+    
+    from_split = allocate_cohorts(cohorts, max_workers=1)
+    from_files = allocate_cohorts(paths, max_workers=2)
+    for name in ['CB', 'ME']:
+        engine = AllocationEngine()
+        assert engine.load_data(str(tmp_path / f'{name}.csv'))
+        expected = engine.allocate_students()
+        assert from_files[name]['allocation'].equals(expected)
+        assert from_split[name]['allocation'].equals(expected)
+    
+    assert save_cohort_results(from_files, str(tmp_path / 'all.csv'), str(tmp_path / 'stats.csv'))
+    combined = pd.read_csv(tmp_path / 'all.csv')
+    assert list(combined.columns) == ['Cohort', 'Roll', 'Name', 'Email', 'CGPA', 'Allocated']
+    assert combined.groupby('Cohort').size().to_dict() == {'CB': 45, 'ME': 45}
+    
+    # Files named alike in different directories would overwrite each other's cohort
+    for dept in ['cse', 'ee']:
+        (tmp_path / dept).mkdir()
+        shutil.copy(paths[0], tmp_path / dept / 'btp.csv')
+    with pytest.raises(ValueError, match="btp"):
+        allocate_cohorts([str(tmp_path / 'cse' / 'btp.csv'), str(tmp_path / 'ee' / 'btp.csv')], max_workers=1)
+
+def test_cli_run_and_exit_codes(tmp_path, caplog):
+    """btp-allocate run writes one output pair per matched input and reports failures in its exit code"""
+    
+    for name in ['a', 'b']:
+        shutil.copy('input_btp_mtp_allocation.csv', tmp_path / f'{name}.csv')
+    output_dir = tmp_path / 'out'
+    
+    assert cli_main(['run', str(tmp_path / '*.csv'), '--output-dir', str(output_dir), '--workers', '1']) == EXIT_OK
+    assert sorted(os.listdir(output_dir)) == ['a_allocation.csv', 'a_preference_stats.csv',
+                                              'b_allocation.csv', 'b_preference_stats.csv']
+    expected = pd.read_csv('input_btp_mtp_allocation.csv')
+    assert len(pd.read_csv(output_dir / 'a_allocation.csv')) == len(expected)
+    
+    assert cli_main(['run', str(tmp_path / 'missing*.csv')]) == EXIT_NO_INPUT
+    assert cli_main(['run', str(tmp_path / 'a.csv'), '--capacities', str(tmp_path / 'missing.csv'),
+                     '--output-dir', str(output_dir)]) == EXIT_FAILURE
+    
+    # --combined honours --format
+    combined_dir = tmp_path / 'combined'
+    assert cli_main(['run', str(tmp_path / '*.csv'), '--output-dir', str(combined_dir), '--workers', '1',
+                     '--combined', '--format', 'json']) == EXIT_OK
+    assert sorted(os.listdir(combined_dir)) == ['allocation.json', 'preference_stats.json']
+    assert len(pd.read_json(combined_dir / 'allocation.json')) == 2 * len(expected)
+    
+    # Inputs that would share output names are rejected before anything is written
+    for dept in ['cse', 'ee']:
+        (tmp_path / 'd' / dept).mkdir(parents=True)
+        shutil.copy('input_btp_mtp_allocation.csv', tmp_path / 'd' / dept / 'btp.csv')
+    clash_dir = tmp_path / 'clash'
+    assert cli_main(['run', str(tmp_path / 'd' / '**' / '*.csv'), '--output-dir', str(clash_dir),
+                     '--workers', '1']) == EXIT_USAGE
+    for dept in ['cse', 'ee']:
+        keyed = pd.read_csv('input_btp_mtp_allocation.csv')
+        keyed.insert(0, 'Dept', 'BTP')
+        keyed.to_csv(tmp_path / 'd' / dept / 'btp.csv', index=False)
+    assert cli_main(['run', str(tmp_path / 'd' / '**' / '*.csv'), '--cohort-column', 'Dept',
+                     '--output-dir', str(clash_dir), '--workers', '1']) == EXIT_USAGE
+    assert not clash_dir.exists()
+    
+    # --cache-dir keeps a parsed copy that the next run and stats load instead of the CSV
+    cache_dir = tmp_path / 'cache'
+    assert cli_main(['run', str(tmp_path / 'a.csv'), '--output-dir', str(output_dir), '--workers', '1',
+                     '--cache-dir', str(cache_dir)]) == EXIT_OK
+    assert os.path.exists(cache_path_for(str(tmp_path / 'a.csv'), str(cache_dir)))
+    with caplog.at_level(logging.INFO, logger='allocation_io'):
+        assert cli_main(['stats', str(tmp_path / 'a.csv'), '--output-dir', str(output_dir),
+                         '--cache-dir', str(cache_dir)]) == EXIT_OK
+    assert any(record.getMessage().startswith('Loaded parsed input from cache') for record in caplog.records)
+
+def test_benchmark_harness():
+    """Synthetic cohorts load like real input and every phase is timed"""
+    
+    cohort = generate_cohort(300, 12, seed=3)
+    ranks = cohort.drop(columns=['Roll', 'Name', 'Email', 'CGPA']).to_numpy()
+    assert (np.sort(ranks, axis=1) == np.arange(1, 13)).all()
+    # Popularity is skewed towards the first faculties
+    first_choices = (ranks == 1).sum(axis=0)
+    assert first_choices[0] > first_choices[-1]
+    
+    results = run_benchmarks([(300, 12)], repeat=1)
+    assert [record['phase'] for record in results['results']] == PHASES
+    assert all(record['students'] == 300 and record['faculties'] == 12 for record in results['results'])
+    
+    slower = {'results': [dict(record, min_seconds=record['min_seconds'] * 10) for record in results['results']]}
+    assert not find_regressions(results, slower, min_seconds=0)
+    assert len(find_regressions(slower, results, min_seconds=0)) == len(PHASES)
+
+def test_engine_metrics(tmp_path):
+    """Phase timers and attempt counters are recorded and appended to the metrics file"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    assert engine.load_capacities({'ABM': 1, 'AE': 1})
+    results = engine.allocate_students()
+    engine.generate_preference_stats()
+    
+    metrics = engine.get_metrics()
+    assert {'load', 'sort', 'allocation', 'stats'} <= set(metrics['timings'])
+    assert metrics['calls']['allocation'] == 1
+    
+    counters = metrics['counters']
+    assert counters['fallback_count'] == int(results['is_fallback'].sum())
+    assert counters['max_rank_probed'] >= results['Preference_Rank'].max()
+    assert sum(counters['attempts_histogram']) == len(results)
+    
+    metrics_file = tmp_path / 'metrics.jsonl'
+    assert engine.save_metrics(str(metrics_file))
+    assert engine.save_metrics(str(metrics_file))
+    lines = metrics_file.read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])['counters'] == json.loads(json.dumps(counters))
+
+def test_fallback_warnings_are_aggregated(tmp_path, caplog):
+    """Fallback assignments produce one summary warning; the queue sink writes it to the log file"""
+    
+    cohort = generate_cohort(200, 10, seed=1, blank_fraction=0.5)
+    engine = AllocationEngine()
+    engine.students_data = cohort
+    engine.faculties = list(cohort.columns[4:])
+    
+    log_path = tmp_path / 'engine.log'
+    listener = start_queue_logging(str(log_path), logger=logging.getLogger('allocation_engine'))
+    try:
+        with caplog.at_level(logging.WARNING, logger='allocation_engine'):
+            results = engine.allocate_students()
+    finally:
+        stop_queue_logging(listener)
+    
+    n_fallback = int(results['is_fallback'].sum())
+    assert n_fallback > 0
+    warnings = [record.getMessage() for record in caplog.records if record.levelno == logging.WARNING]
+    assert warnings == [warnings[0]] and warnings[0].startswith(f"{n_fallback} unallocated students")
+    assert warnings[0] in log_path.read_text()
+
+def test_imports_have_no_side_effects():
+    """Importing the engine installs no log handlers and the CLI parser loads without pandas"""
+    
+    code = ("import logging, sys, allocation_cli; allocation_cli.build_parser(); "
+            "assert 'pandas' not in sys.modules and 'http.server' not in sys.modules; "
+            "import allocation_engine; assert not logging.getLogger().handlers")
+    subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+def test_cli_log_file_keeps_info_when_console_is_quiet(tmp_path):
+    """btp-allocate -q --log-file only quiets the console; the log file still gets INFO"""
+    
+    log_path = tmp_path / 'cli.log'
+    run = subprocess.run([sys.executable, 'allocation_cli.py', '-q', '--log-file', str(log_path), 'stats',
+                          'input_btp_mtp_allocation.csv', '--output-dir', str(tmp_path)],
+                         cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+    assert 'INFO' not in run.stderr
+    assert 'Loading data from input_btp_mtp_allocation.csv' in log_path.read_text()
+
+def test_prometheus_exporter(tmp_path):
+    """Runs, phases and errors are exported in the Prometheus text format over HTTP and to a textfile"""
+    
+    registry = MetricsRegistry()
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    with track_run(len(engine.students_data), upload_bytes=4096, registry=registry):
+        engine.allocate_students()
+    with pytest.raises(ValueError):
+        with track_run(10, registry=registry):
+            raise ValueError("bad upload")
+    
+    assert registry.value('allocation_runs_total', outcome='success') == 1
+    assert registry.value('rows_processed_total') == len(engine.students_data)
+    assert registry.value('errors_total', stage='allocation', error='ValueError') == 1
+    assert registry.value('upload_size_bytes') == 1
+    
+    text = registry.render()
+    assert '# TYPE btp_allocation_run_seconds histogram' in text
+    assert 'btp_upload_size_bytes_bucket{le="10240"} 1' in text
+    assert 'btp_allocation_run_seconds_count{outcome="error"} 1' in text
+    # Engine phases always go to the shared registry
+    assert REGISTRY.value('engine_phase_seconds', phase='allocation') >= 1
+    
+    textfile = tmp_path / 'btp.prom'
+    assert registry.write_textfile(str(textfile))
+    assert textfile.read_text() == text
+    
+    server = start_http_server(0, '127.0.0.1', registry=registry)
+    assert start_http_server(0, '127.0.0.1') is server
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+        assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+        assert response.read().decode() == registry.render()
+
+def test_summary_counts_every_rank():
+    """The summary reports typed counts for every rank plus fallbacks"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    results = engine.allocate_students()
+    
+    assert str(results['Preference_Rank'].dtype) == 'Int16'
+    assert results['is_fallback'].dtype == bool
+    
+    summary = engine.get_allocation_summary()
+    satisfaction = summary['preference_satisfaction']
+    assert sum(summary['rank_distribution'].values()) + satisfaction['fallback'] == len(results)
+    assert satisfaction['other'] == sum(count for rank, count in summary['rank_distribution'].items() if rank > 3)
+    assert satisfaction['pref_1'] == (results['Preference_Rank'] == 1).sum()
+
+def test_preference_stats_match_column_scan():
+    """The bincount histogram matches a per faculty, per rank count"""
+    
+    engine = AllocationEngine()
+    assert engine.load_data('input_btp_mtp_allocation.csv')
+    stats = engine.generate_preference_stats()
+    
+    assert list(stats.columns) == ['Fac'] + [f'Count Pref {rank}' for rank in range(1, len(engine.faculties) + 1)]
+    for row, faculty in enumerate(engine.faculties):
+        assert stats.at[row, 'Fac'] == faculty
+        for rank in range(1, len(engine.faculties) + 1):
+            assert stats.at[row, f'Count Pref {rank}'] == (engine.students_data[faculty] == rank).sum()
+
+def test_chunked_loading_matches_full_load():
+    """Streaming the input in small blocks gives the same allocation and stats"""
+    
+    full = AllocationEngine()
+    assert full.load_data('input_btp_mtp_allocation.csv')
+    
+    chunked = AllocationEngine()
+    assert chunked.load_data('input_btp_mtp_allocation.csv', chunksize=16)
+    
+    # Ranks stay in one int16 matrix; the frame holds only the identity columns
+    assert chunked.faculties == full.faculties
+    assert chunked.rank_matrix.dtype == np.int16
+    assert chunked.rank_matrix.shape == (len(full.students_data), len(full.faculties))
+    assert list(chunked.students_data.columns) == ['Roll', 'Name', 'Email', 'CGPA']
+    assert np.array_equal(chunked.rank_block(), full.rank_block())
+    assert chunked.allocate_students().equals(full.allocate_students())
+    assert chunked.generate_preference_stats().equals(full.generate_preference_stats())
+
+def test_input_cache_reused_and_invalidated(tmp_path):
+    """The parsed-input sidecar is reused for the same file and ignored once it changes"""
+    
+    pyarrow = pytest.importorskip('pyarrow')
+    input_file = tmp_path / 'input.csv'
+    shutil.copy('input_btp_mtp_allocation.csv', input_file)
+    
+    first = AllocationEngine()
+    assert first.load_data(str(input_file), use_cache=True)
+    assert os.path.exists(cache_path_for(str(input_file)))
+    
+    # Numeric columns are views of the memory-mapped Arrow buffers: nothing that
+    # size is allocated (consolidating them would copy ranks and CGPA)
+    allocated = pyarrow.total_allocated_bytes()
+    cached = load_students_cache(str(input_file))
+    numeric_bytes = first.students_data[['CGPA'] + first.faculties].memory_usage(index=False).sum()
+    assert pyarrow.total_allocated_bytes() - allocated < numeric_bytes
+    
+    assert cached is not None
+    assert cached[0].equals(first.students_data)
+    assert cached[1] == first.faculties
+    
+    # A touched or edited input must not be served from the old sidecar
+    os.utime(input_file, ns=(0, 0))
+    assert load_students_cache(str(input_file)) is None
+
+def test_upload_digest_matches_file_digest():
+    """Uploads and files on disk with the same contents share one cache key"""
+    
+    with open('input_btp_mtp_allocation.csv', 'rb') as handle:
+        data = handle.read()
+    assert content_digest(data) == file_digest('input_btp_mtp_allocation.csv')
+    assert content_digest(data + b'\n') != content_digest(data)
+
+def test_memory_mapped_rank_matrix(tmp_path):
+    """An engine holding only identity columns plus a mapped rank matrix gives the same results"""
+    
+    full = AllocationEngine()
+    assert full.load_data('input_btp_mtp_allocation.csv')
+    matrix_file = str(tmp_path / 'ranks.npy')
+    assert full.save_rank_matrix(matrix_file)
+    
+    worker = AllocationEngine()
+    worker.faculties = full.faculties
+    worker.students_data = full.students_data[['Roll', 'Name', 'Email', 'CGPA']]
+    assert worker.load_rank_matrix(matrix_file)
+    assert isinstance(worker.rank_matrix, np.memmap)
+    assert not worker.rank_matrix.flags.writeable
+    
+    assert worker.allocate_students().equals(full.allocate_students())
+    assert worker.generate_preference_stats().equals(full.generate_preference_stats())
+    
+    # A matrix that does not match the cohort is rejected
+    worker.students_data = worker.students_data.iloc[:-1]
+    assert not worker.load_rank_matrix(matrix_file)
+
 def validate_results():
     """Validate the allocation results"""
     